@@ -18,6 +18,8 @@ class MoldVisionApp:
         self.state.add_listener(self._active_changed)
         self._build_ui()
 
+        self.master.protocol("WM_DELETE_WINDOW", self._on_close)
+
 
     def _build_ui(self):
         self.left = LeftSidebar(self.master, self.state)
@@ -26,10 +28,16 @@ class MoldVisionApp:
         self.portfolio = Portfolio(self.master, self.state)
         self.portfolio.pack(side="left", fill="both", expand=True)
         
-        self.right = RightSidebar(self.master, self.state, self.processor)
+        self.right = RightSidebar(self.master, self.state, self.processor, on_preview=self.portfolio.show_preview)
         self.right.pack(side="right", fill="y")
 
 
+    def _on_close(self):
+        self.left.shutdown()
+        self.right.shutdown()
+        self.master.destroy()
+
+
     def _active_changed(self):
         self.left.refresh()
         self.portfolio.refresh()
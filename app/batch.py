@@ -0,0 +1,251 @@
+from .defs import EXTS, PreprocessParams, DetectParams
+from .export import unique_stems
+from .state import ImageState, set_store_budget
+from .pipeline.imageio import read_shape
+from .pipeline.processor import Processor
+from .pipeline.trace import TRACE, export_chrome_trace
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+
+
+SUMMARY_FIELDS = [
+    "file",
+    "status",
+    "width",
+    "height",
+    "texture",
+    "info",
+    "coverage",
+    "components",
+    "threshold",
+    "overlay",
+    "mask",
+    "seconds",
+    "error",
+]
+
+# per-process state, set up once by _init_worker
+_worker = {}
+
+
+def collect_paths(inputs, recursive=False):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.glob(item, recursive=recursive)
+
+        for path in sorted(candidates):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in EXTS:
+                paths.append(path)
+
+    # keep order, drop duplicates from overlapping inputs
+    return list(dict.fromkeys(paths))
+
+
+def load_preset(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    return (
+        _params_from_dict(PreprocessParams, data.get("preprocess", {})),
+        _params_from_dict(DetectParams, data.get("detect", {})),
+        bool(data.get("custom", True)),
+    )
+
+
+def _params_from_dict(cls, values):
+    known = {f.name for f in fields(cls)}
+    unknown = set(values) - known
+    if unknown:
+        raise ValueError(f"Unknown {cls.__name__} keys: {', '.join(sorted(unknown))}")
+    return cls(**values)
+
+
+def _init_worker(preprocess_params, detect_params, custom, out_dir, store_mb=None, trace=False,
+                 full_res_output=False):
+    # one process per core already, keep opencv from oversubscribing
+    cv2.setNumThreads(1)
+    if store_mb is not None: set_store_budget(store_mb)
+    TRACE.enable(trace)
+
+    _worker["processor"] = Processor()
+    _worker["preprocess_params"] = preprocess_params
+    _worker["detect_params"] = detect_params
+    _worker["custom"] = custom
+    _worker["out_dir"] = out_dir
+    _worker["full_res_output"] = full_res_output
+
+
+def _process_one(job):
+    # the stem is picked by the parent, unique over the whole batch
+    path, stem = job
+    row = dict.fromkeys(SUMMARY_FIELDS, "")
+    row["file"] = path
+    start = time.perf_counter()
+    st = None
+
+    try:
+        # the working image comes from a reduced decode, exactly as in the
+        # GUI; the full decode happens only for full resolution output (or
+        # full resolution detection)
+        st = ImageState(
+            path=path,
+            filename=os.path.basename(path),
+            shape=read_shape(path),
+            preprocess_params=PreprocessParams(**asdict(_worker["preprocess_params"])),
+            detect_params=DetectParams(**asdict(_worker["detect_params"])),
+        )
+        st.custom = _worker["custom"]
+
+        processor = _worker["processor"]
+        st.preprocessed = processor.preprocess(st)
+
+        result = processor.detect(st)
+        if result is None:
+            raise ValueError("Detection produced no mask")
+
+        # overlay and mask at the working resolution unless asked for full
+        # resolution, the mask resized the way the overlay is tinted with
+        base = st.original if _worker["full_res_output"] else st.scaled
+        h, w = base.shape[:2]
+        mask = result.mask.resized(w, h)
+        overlay = processor._apply_mask(base, mask)
+
+        overlay_path = os.path.join(_worker["out_dir"], f"{stem}_overlay.png")
+        mask_path = os.path.join(_worker["out_dir"], f"{stem}_mask.png")
+        cv2.imwrite(overlay_path, overlay)
+        cv2.imwrite(mask_path, mask)
+
+        h, w = st.shape[:2]
+        row.update(
+            status="ok",
+            width=w,
+            height=h,
+            texture=st.preprocessed.texture,
+            info=st.info,
+            coverage=f"{result.affected_ratio:.6f}",
+            components=result.components,
+            threshold="" if result.threshold is None else f"{result.threshold:g}",
+            overlay=overlay_path,
+            mask=mask_path,
+        )
+    except Exception as e:
+        row.update(status="error", error=str(e))
+    finally:
+        # the store is shared by the whole worker process
+        if st is not None: st.release()
+
+    row["seconds"] = f"{time.perf_counter() - start:.3f}"
+    # this image's stage timings ride back with its row
+    if TRACE.enabled: row["_trace"] = TRACE.drain()
+    return row
+
+
+def run_batch(paths, out_dir, preprocess_params=None, detect_params=None, custom=False,
+              workers=None, chunksize=4, progress=None, store_mb=None, trace_path=None,
+              full_res_output=False):
+    os.makedirs(out_dir, exist_ok=True)
+
+    init_args = (
+        preprocess_params or PreprocessParams(),
+        detect_params or DetectParams(),
+        custom,
+        out_dir,
+        store_mb,
+        trace_path is not None,
+        full_res_output,
+    )
+
+    # same named inputs (x.jpg / x.png, folders walked with -r) would
+    # write over each other's outputs
+    jobs = list(zip(paths, unique_stems(paths)))
+
+    rows = []
+    events = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+        for row in pool.map(_process_one, jobs, chunksize=max(1, chunksize)):
+            events.extend(row.pop("_trace", ()))
+            rows.append(row)
+            if progress:
+                progress(len(rows), len(paths), row)
+
+    summary_path = os.path.join(out_dir, "summary.csv")
+    with open(summary_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    if trace_path is not None:
+        export_chrome_trace(trace_path, events)
+
+    return rows, summary_path
+
+
+def _print_progress(done, total, row):
+    status = row["status"] if row["status"] == "ok" else f"error: {row['error']}"
+    print(f"[{done}/{total}] {row['file']} ({row['seconds']}s) {status}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run MoldVision detection headless over a batch of images.")
+    parser.add_argument("inputs", nargs="+", help="image files, folders or glob patterns")
+    parser.add_argument("-o", "--out", required=True, help="output folder for overlays, masks and summary.csv")
+    parser.add_argument("-p", "--preset", help="JSON file with 'preprocess' / 'detect' params (enables custom mode)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=4, help="images handed to a worker at a time")
+    parser.add_argument("--store-mb", type=float, help="per worker budget for decoded and derived images (default $MOLDVISION_STORE_MB or 1024)")
+    parser.add_argument("--trace", help="write per stage timings of every image as a Chrome trace JSON")
+    parser.add_argument("--full-res-output", action="store_true", help="write overlays and masks at full resolution (a full decode per image; default: working resolution)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into sub folders")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args(argv)
+
+    paths = collect_paths(args.inputs, recursive=args.recursive)
+    if not paths:
+        print(f"No images found (supported: {', '.join(EXTS)})", file=sys.stderr)
+        return 1
+
+    if args.preset:
+        pre_params, det_params, custom = load_preset(args.preset)
+    else:
+        pre_params, det_params, custom = PreprocessParams(), DetectParams(), False
+
+    start = time.perf_counter()
+    rows, summary_path = run_batch(
+        paths,
+        args.out,
+        preprocess_params=pre_params,
+        detect_params=det_params,
+        custom=custom,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        store_mb=args.store_mb,
+        trace_path=args.trace,
+        full_res_output=args.full_res_output,
+        progress=None if args.quiet else _print_progress,
+    )
+
+    failed = sum(1 for r in rows if r["status"] != "ok")
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(rows)} images in {elapsed:.1f}s ({failed} failed) -> {summary_path}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
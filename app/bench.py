@@ -0,0 +1,283 @@
+from .defs import EXTS, PREPROCESS_METHODS, DETECT_METHODS, TH_MODES, DetectParams
+from .state import ImageState, PreprocessedImage
+from .pipeline.imageio import load_image
+from .pipeline.processor import Processor, _HAS_SKIMG
+
+from dataclasses import replace
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+
+DEFAULT_SIZES = [512, 1024, 2048]
+# a regression must be this much slower relative and absolute, so
+# sub-millisecond jitter on tiny stages does not trip it
+DEFAULT_TOLERANCE = 0.15
+DEFAULT_MIN_DELTA_MS = 0.5
+
+
+class Case:
+    # One input image at one size, with the intermediates every stage
+    # starts from computed once up front (untimed).
+
+    def __init__(self, name, img: np.ndarray, processor: Processor):
+        self.name = name
+        self.img = img
+        self.gray = processor._to_grayscale(img, "weighted")
+        self.texture = processor._estimate_texture_level(self.gray)
+
+        self.params = DetectParams()
+        st = self.state(processor)
+        self.scales = processor._get_scales(st)
+        self.var_map = processor._variance_multiscale(self.gray.copy(), scales=self.scales)
+        th = processor._compute_threshold(self.var_map, self.params)
+        self.raw_mask = (self.var_map > th).astype(np.uint8) * 255
+        self.area_mask = processor._filter_components_by_area(self.raw_mask, self.params.min_area, self.params.max_area)
+
+
+    @property
+    def shape(self):
+        return self.img.shape[:2]
+
+
+    def state(self, processor: Processor, **detect):
+        # keyless preprocessed image: every stage runs uncached
+        st = ImageState(self.name, self.name, original=self.img, detect_params=replace(self.params, **detect))
+        st.custom = True
+        st.preprocessed = PreprocessedImage(img=self.gray.copy(), texture=self.texture)
+        return st
+
+
+def stages(processor: Processor):
+    # (name, setup(case) -> args, fn(*args)); setup runs untimed before every
+    # call, so memoized state (variance engines, the store) is rebuilt each
+    # time and the call measures a cold stage
+    p = processor
+
+    out = [
+        ("scale_img", lambda c: (c.img,), lambda img: p._scale_img(img, 1024)),
+    ]
+    for m in PREPROCESS_METHODS:
+        out.append((f"to_grayscale[{m}]", lambda c: (c.img,), lambda img, m=m: p._to_grayscale(img, m)))
+
+    out += [
+        ("apply_clahe", lambda c: (c.gray,), lambda g: p._apply_clahe(g)),
+        ("estimate_texture_level", lambda c: (c.gray.copy(),), lambda g: p._estimate_texture_level(g)),
+        ("variance_multiscale", lambda c: (c.gray.copy(), c.scales), lambda g, s: p._variance_multiscale(g, scales=s)),
+    ]
+    for mode in TH_MODES:
+        out.append((
+            f"compute_threshold[{mode}]",
+            lambda c, mode=mode: (c.var_map, replace(c.params, th_mode=mode)),
+            lambda v, params: p._compute_threshold(v, params),
+        ))
+
+    out += [
+        ("filter_components_by_area", lambda c: (c.raw_mask, c.params), lambda m, d: p._filter_components_by_area(m, d.min_area, d.max_area)),
+        ("morph_refine", lambda c: (c.area_mask, c.params), lambda m, d: p._morph_refine(m, d.elemsize, d.open_iter, d.close_iter)),
+        ("apply_mask", lambda c: (c.img, c.area_mask), lambda img, m: p._apply_mask(img, m)),
+    ]
+    if _HAS_SKIMG:
+        out.append(("refine_with_lbp", lambda c: (c.gray, c.area_mask, c.params), lambda g, m, d: p._refine_with_lbp(g, m, d)))
+
+    for m in DETECT_METHODS:
+        detect = dict(method=m, use_lbp=(m == "var_lbp"))
+        if m == "var_lbp" and not _HAS_SKIMG: continue
+        out.append((
+            f"detect[{m}]",
+            lambda c, detect=detect: (c.state(p, **detect), detect["method"]),
+            lambda st, m: p._dispatch_manual_detect(st, m),
+        ))
+
+    return out
+
+
+def load_cases(inputs, sizes, processor: Processor, synthetic=True):
+    # every input image resized so its longest side is each of `sizes`;
+    # synthetic noise images stand in when there is no input
+    sources = []
+    for item in inputs:
+        pattern = os.path.join(item, "*") if os.path.isdir(item) else item
+        for path in sorted(glob.glob(pattern)):
+            if os.path.splitext(path)[1].lower() in EXTS:
+                sources.append((os.path.basename(path), load_image(path)))
+
+    if synthetic or not sources:
+        sources.append(("synthetic", _synthetic_image(max(sizes))))
+
+    cases = []
+    for name, img in sources:
+        for size in sizes:
+            f = size / max(img.shape[:2])
+            w, h = max(1, round(img.shape[1] * f)), max(1, round(img.shape[0] * f))
+            interp = cv2.INTER_AREA if f < 1.0 else cv2.INTER_CUBIC
+            cases.append(Case(f"{name}@{size}", cv2.resize(img, (w, h), interpolation=interp), processor))
+
+    return cases
+
+
+def _synthetic_image(size, seed=0):
+    # smooth wall-like background with a few high texture blobs
+    rng = np.random.default_rng(seed)
+    h, w = size * 3 // 4, size
+
+    base = cv2.resize(rng.integers(90, 170, (h // 64 + 2, w // 64 + 2, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 4, (h, w, 3))
+
+    texture = rng.normal(0, 40, (h, w, 3))
+    blobs = np.zeros((h, w), np.uint8)
+    for _ in range(12):
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        cv2.circle(blobs, center, int(rng.integers(size // 60, size // 12)), 1, -1)
+
+    img = base + noise + texture * blobs[:, :, None]
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def time_stage(setup, fn, case, repeat, warmup=1):
+    times = []
+    for i in range(warmup + repeat):
+        args = setup(case)
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        if i >= warmup: times.append(elapsed * 1000.0)
+
+    # one extra call under tracemalloc: numpy and opencv outputs are
+    # tracked, opencv internal scratch buffers are not
+    args = setup(case)
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = np.array(times)
+    return {
+        "median_ms": round(float(np.median(times)), 4),
+        "p95_ms": round(float(np.percentile(times, 95)), 4),
+        "min_ms": round(float(times.min()), 4),
+        "peak_mb": round(peak / (1024 * 1024), 3),
+        "runs": repeat,
+    }
+
+
+def run_bench(cases, processor: Processor, repeat=10, only=None, progress=None):
+    todo = [s for s in stages(processor) if not only or any(o in s[0] for o in only)]
+
+    results = []
+    for case in cases:
+        for name, setup, fn in todo:
+            row = {"stage": name, "case": case.name, "shape": list(case.shape)}
+            row.update(time_stage(setup, fn, case, repeat))
+            results.append(row)
+            if progress:
+                progress(len(results), len(cases) * len(todo), row)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads(),
+            "repeat": repeat,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    # rows of (stage, case, baseline ms, current ms, ratio, regressed) for
+    # every stage / case present in both reports, by median
+    old = {(r["stage"], r["case"]): r for r in baseline["results"]}
+
+    rows = []
+    for r in report["results"]:
+        b = old.get((r["stage"], r["case"]))
+        if b is None: continue
+
+        before, now = b["median_ms"], r["median_ms"]
+        ratio = now / before if before > 0 else float("inf")
+        regressed = ratio > 1.0 + tolerance and now - before > min_delta_ms
+        rows.append((r["stage"], r["case"], before, now, ratio, regressed))
+
+    return rows
+
+
+def _print_progress(done, total, row, file=None):
+    print(f"[{done}/{total}] {row['case']:<20} {row['stage']:<32} "
+          f"median {row['median_ms']:9.2f} ms  p95 {row['p95_ms']:9.2f} ms  peak {row['peak_mb']:8.2f} MB",
+          file=file, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every MoldVision processing stage at several image sizes.")
+    parser.add_argument("inputs", nargs="*", default=["data"], help="image files, folders or glob patterns (default: data)")
+    parser.add_argument("-s", "--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated longest sides")
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="timed calls per stage and case")
+    parser.add_argument("-k", "--only", action="append", help="only stages whose name contains this (repeatable)")
+    parser.add_argument("-o", "--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("-b", "--baseline", help="JSON report to compare against, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown of the median")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS, help="ignore slowdowns smaller than this")
+    parser.add_argument("--no-synthetic", action="store_true", help="skip the synthetic image when inputs are given")
+    parser.add_argument("--threads", type=int, help="opencv worker threads (default: opencv's choice)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no per stage progress")
+    args = parser.parse_args(argv)
+
+    if args.threads is not None: cv2.setNumThreads(args.threads)
+
+    try:
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError:
+        print(f"Bad --sizes: {args.sizes}", file=sys.stderr)
+        return 2
+
+    processor = Processor()
+    cases = load_cases(args.inputs, sizes, processor, synthetic=not args.no_synthetic)
+    # progress goes to stderr when the report itself goes to stdout
+    log = sys.stderr if args.out is None else sys.stdout
+
+    report = run_bench(
+        cases, processor, repeat=max(1, args.repeat), only=args.only,
+        progress=None if args.quiet else lambda done, total, row: _print_progress(done, total, row, file=log),
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"{len(report['results'])} timings -> {args.out}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if not args.baseline: return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    rows = compare(report, baseline, args.tolerance, args.min_delta_ms)
+    regressions = [r for r in rows if r[5]]
+    for stage, case, before, now, ratio, regressed in rows:
+        if regressed or not args.quiet:
+            flag = "REGRESSION" if regressed else ""
+            print(f"{case:<20} {stage:<32} {before:9.2f} -> {now:9.2f} ms  x{ratio:5.2f} {flag}", file=log)
+
+    print(f"{len(rows)} compared, {len(regressions)} regressions", file=log)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-import numpy as np
+import os
 
 
 EXTS = (
@@ -30,11 +30,32 @@ TH_MODES = [
     "fixed",
 ]
 
+EXPORT_FORMATS = [
+    "png",
+    "jpg",
+    "webp",
+]
 
-@dataclass
-class PreprocessedImage:
-    img: np.ndarray | None = None
-    texture: str = "low_txt"
+# shared LRU holding decoded originals and every derived array,
+# MOLDVISION_STORE_MB overrides the byte budget
+STORE_ENTRIES = 8192
+STORE_BYTES = int(os.environ.get("MOLDVISION_STORE_MB", 1024)) * 1024 * 1024
+
+# longest side of the working image preprocessing and detection run on
+WORK_MAX_DIM = 1024
+
+# pixels of the nearest-neighbour thumbnail auto grayscale measures the
+# mean saturation on
+AUTO_GRAY_SAMPLES = 65536
+
+# coarse-to-fine: full res work happens on tiles of this size near
+# candidates only; past REFINE_MAX_ACTIVE of the tiles it runs them all.
+# Variance bounds and threshold are estimated from every
+# REFINE_SAMPLE_EVERY-th other tile, but no fewer than REFINE_SAMPLE_MIN
+REFINE_TILE = 256
+REFINE_MAX_ACTIVE = 0.5
+REFINE_SAMPLE_EVERY = 7
+REFINE_SAMPLE_MIN = 32
 
 
 @dataclass
@@ -67,4 +88,26 @@ class DetectParams:
     edge_t1: int = 50
     edge_t2: int = 150
     edge_kernel: int = 9
-    edge_density_th: int = 20
\ No newline at end of file
+    edge_density_th: int = 20
+    # variance detection on the full resolution original, tile by tile
+    full_res: bool = False
+    tile_size: int = 2048
+    # with full_res: find candidates on the working image, run full res
+    # only on tiles within refine_margin of them. Pays off for sparse
+    # detections (high percentile / fixed threshold); the estimated
+    # threshold can drift from the exact one and mold far from any
+    # candidate is missed. Off with zscore, where the estimate is poor
+    coarse_to_fine: bool = False
+    refine_margin: int = 32
+
+
+@dataclass
+class ExportParams:
+    # format of originals and overlays; masks are always 1-bit PNG
+    fmt: str = EXPORT_FORMATS[0]
+    png_compression: int = 1
+    # jpg and webp
+    quality: int = 95
+    originals: bool = True
+    overlays: bool = True
+    masks: bool = True
\ No newline at end of file
@@ -0,0 +1,115 @@
+from ..defs import EXPORT_FORMATS, ExportParams
+
+import tkinter as tk
+from tkinter import ttk, filedialog
+import copy
+
+
+class ExportDialog(tk.Toplevel):
+    # Options for Export All. on_export(params, folder) runs once the
+    # folder is picked; the dialog edits a copy of `params`.
+
+    def __init__(self, parent, params: ExportParams, on_export, folder=""):
+        super().__init__(parent)
+        self.title("Export All")
+        self.configure(bg="#f4f4f4")
+        self.resizable(False, False)
+        self.transient(parent)
+
+        self.params = copy.copy(params)
+        self.on_export = on_export
+
+        self.fmt_var = tk.StringVar(value=self.params.fmt)
+        self.png_compression_var = tk.IntVar(value=self.params.png_compression)
+        self.quality_var = tk.IntVar(value=self.params.quality)
+        self.originals_var = tk.BooleanVar(value=self.params.originals)
+        self.overlays_var = tk.BooleanVar(value=self.params.overlays)
+        self.masks_var = tk.BooleanVar(value=self.params.masks)
+        self.folder_var = tk.StringVar(value=folder)
+
+        self._build_ui()
+        self._update_state()
+
+
+    def _build_ui(self):
+        body = tk.Frame(self, bg="#f4f4f4")
+        body.pack(fill="both", expand=True, padx=16, pady=12)
+
+        tk.Label(body, text="Format", bg="#f4f4f4", fg="#444").grid(row=0, column=0, sticky="w", pady=4)
+        cb_fmt = ttk.Combobox(body, textvariable=self.fmt_var, values=EXPORT_FORMATS, state="readonly", width=8)
+        cb_fmt.grid(row=0, column=1, sticky="w", pady=4)
+        cb_fmt.bind("<<ComboboxSelected>>", lambda e: self._update_state())
+
+        tk.Label(body, text="PNG Compression", bg="#f4f4f4", fg="#444").grid(row=1, column=0, sticky="w")
+        self.sc_png = tk.Scale(body, variable=self.png_compression_var, from_=0, to=9, orient="horizontal", bg="#f4f4f4", highlightthickness=0, length=180)
+        self.sc_png.grid(row=1, column=1, sticky="w")
+
+        tk.Label(body, text="Quality", bg="#f4f4f4", fg="#444").grid(row=2, column=0, sticky="w")
+        self.sc_quality = tk.Scale(body, variable=self.quality_var, from_=1, to=100, orient="horizontal", bg="#f4f4f4", highlightthickness=0, length=180)
+        self.sc_quality.grid(row=2, column=1, sticky="w")
+
+        outputs = tk.Frame(body, bg="#f4f4f4")
+        outputs.grid(row=3, column=0, columnspan=2, sticky="w", pady=(8, 4))
+        for text, var in (("Originals", self.originals_var), ("Overlays", self.overlays_var), ("Masks (1-bit PNG)", self.masks_var)):
+            tk.Checkbutton(outputs, text=text, variable=var, bg="#f4f4f4", command=self._update_state).pack(side="left", padx=(0, 8))
+
+        tk.Button(
+            body, text="Masks Only", command=self._masks_only,
+            relief="flat", bg="#e0e0e0", cursor="hand2"
+        ).grid(row=4, column=0, sticky="w", pady=4)
+
+        folder = tk.Frame(body, bg="#f4f4f4")
+        folder.grid(row=5, column=0, columnspan=2, sticky="we", pady=(8, 4))
+        tk.Entry(folder, textvariable=self.folder_var, width=36).pack(side="left", fill="x", expand=True)
+        tk.Button(folder, text="...", command=self._browse, relief="flat", bg="#e0e0e0", cursor="hand2", width=3).pack(side="left", padx=(4, 0))
+
+        actions = tk.Frame(self, bg="#f4f4f4")
+        actions.pack(fill="x", padx=16, pady=(0, 12))
+        tk.Button(actions, text="Cancel", command=self.destroy, relief="flat", bg="#e0e0e0", cursor="hand2", width=10).pack(side="right")
+        self.btn_export = tk.Button(
+            actions, text="Export", command=self._export,
+            relief="flat", bg="#2196f3", fg="white", cursor="hand2", width=10
+        )
+        self.btn_export.pack(side="right", padx=(0, 8))
+
+
+    def _update_state(self):
+        fmt = self.fmt_var.get()
+        # compression applies to PNG originals / overlays and to the masks
+        png_used = fmt == "png" or self.masks_var.get()
+        self.sc_png.config(state="normal" if png_used else "disabled")
+        self.sc_quality.config(state="normal" if fmt != "png" else "disabled")
+
+        anything = self.originals_var.get() or self.overlays_var.get() or self.masks_var.get()
+        self.btn_export.config(state="normal" if anything else "disabled")
+
+
+    def _masks_only(self):
+        self.originals_var.set(False)
+        self.overlays_var.set(False)
+        self.masks_var.set(True)
+        self._update_state()
+
+
+    def _browse(self):
+        folder = filedialog.askdirectory(parent=self, title="Export Folder", initialdir=self.folder_var.get() or None)
+        if folder: self.folder_var.set(folder)
+
+
+    def _export(self):
+        folder = self.folder_var.get().strip()
+        if not folder:
+            self._browse()
+            folder = self.folder_var.get().strip()
+            if not folder: return
+
+        p = self.params
+        p.fmt = self.fmt_var.get()
+        p.png_compression = self.png_compression_var.get()
+        p.quality = self.quality_var.get()
+        p.originals = self.originals_var.get()
+        p.overlays = self.overlays_var.get()
+        p.masks = self.masks_var.get()
+
+        self.destroy()
+        self.on_export(p, folder)
@@ -0,0 +1,140 @@
+import tkinter as tk
+import numpy as np
+
+
+class HistogramPanel(tk.Toplevel):
+    # 256-bin histogram of the uint8 variance map with a draggable threshold
+    # line. on_threshold(value) fires on every drag step, on_commit(value)
+    # once the line is released. Only the line moves while dragging, the
+    # bars are drawn again on new data or a resize.
+
+    PAD = 28
+
+    def __init__(self, parent, on_threshold=None, on_commit=None, width=520, height=240):
+        super().__init__(parent)
+        self.title("Variance Histogram")
+        self.configure(bg="#f4f4f4")
+
+        self.on_threshold = on_threshold
+        self.on_commit = on_commit
+
+        self.hist = None
+        self.th = None
+        self._dragging = False
+
+        self.canvas = tk.Canvas(self, width=width, height=height, bg="#ffffff", highlightthickness=0, cursor="sb_h_double_arrow")
+        self.canvas.pack(fill="both", expand=True, padx=8, pady=(8, 0))
+
+        bottom = tk.Frame(self, bg="#f4f4f4")
+        bottom.pack(fill="x", padx=8, pady=8)
+
+        self.lbl_stats = tk.Label(bottom, text="", bg="#f4f4f4", fg="#444", anchor="w")
+        self.lbl_stats.pack(side="left", fill="x", expand=True)
+
+        self.log_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(bottom, text="Log scale", variable=self.log_var, bg="#f4f4f4", command=self._draw).pack(side="right")
+
+        self.canvas.bind("<Configure>", lambda e: self._draw())
+        self.canvas.bind("<Button-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+
+
+    def set_data(self, hist: np.ndarray | None, th, title=""):
+        # a drag in progress keeps its own threshold
+        self.hist = hist
+        if not self._dragging: self.th = th
+        self.title(f"Variance Histogram - {title}" if title else "Variance Histogram")
+        self._draw()
+
+
+    # ====================== DRAWING ======================
+
+    def _plot_area(self):
+        w = max(self.canvas.winfo_width(), 2 * self.PAD + 1)
+        h = max(self.canvas.winfo_height(), 2 * self.PAD + 1)
+        return self.PAD, 8, w - 8, h - self.PAD
+
+
+    def _x_of(self, value):
+        x0, _, x1, _ = self._plot_area()
+        return x0 + (x1 - x0) * (float(value) + 0.5) / 256.0
+
+
+    def _value_of(self, x):
+        x0, _, x1, _ = self._plot_area()
+        return int(np.clip(np.floor((x - x0) / (x1 - x0) * 256.0), 0, 255))
+
+
+    def _draw(self):
+        c = self.canvas
+        c.delete("all")
+        if self.hist is None:
+            self.lbl_stats.config(text="No variance map (preprocess first)")
+            return
+
+        x0, y0, x1, y1 = self._plot_area()
+        counts = self.hist.astype(np.float64)
+        if self.log_var.get():
+            counts = np.log1p(counts)
+        top = counts.max() or 1.0
+
+        # all 256 bars as one polygon instead of 256 canvas items
+        xs = x0 + (x1 - x0) * np.arange(257) / 256.0
+        ys = y1 - (y1 - y0) * counts / top
+        points = [x0, y1]
+        for i in range(256):
+            points += [xs[i], ys[i], xs[i + 1], ys[i]]
+        points += [x1, y1]
+        c.create_polygon(*points, fill="#9e9e9e", outline="")
+
+        c.create_line(x0, y1, x1, y1, fill="#666")
+        for v in (0, 64, 128, 192, 255):
+            x = self._x_of(v)
+            c.create_line(x, y1, x, y1 + 4, fill="#666")
+            c.create_text(x, y1 + 6, text=str(v), anchor="n", fill="#666", font=("Segoe UI", 8))
+
+        if self.th is not None:
+            c.create_line(0, y0, 0, y1, fill="#e53935", width=2, dash=(4, 2), tags="th")
+        self._draw_threshold()
+
+
+    def _draw_threshold(self):
+        if self.hist is None or self.th is None: return
+
+        _, y0, _, y1 = self._plot_area()
+        x = self._x_of(self.th)
+        self.canvas.coords("th", x, y0, x, y1)
+
+        # the mask is var > th: every bin from floor(th) + 1 up
+        total = max(1, int(self.hist.sum()))
+        above = int(self.hist[int(np.floor(self.th)) + 1:].sum())
+        self.lbl_stats.config(text=f"Threshold: {self.th:.1f} | Above: {above / total:.2%} of pixels")
+
+
+    # ====================== DRAG ======================
+
+    def _on_press(self, event):
+        if self.hist is None: return
+        self._dragging = True
+        self._on_drag(event)
+
+
+    def _on_drag(self, event):
+        if not self._dragging: return
+
+        value = self._value_of(event.x)
+        if value == self.th: return
+
+        first = self.th is None
+        self.th = value
+        if first: self._draw()
+        else: self._draw_threshold()
+
+        if self.on_threshold: self.on_threshold(value)
+
+
+    def _on_release(self, event):
+        if not self._dragging: return
+        self._dragging = False
+        if self.on_commit: self.on_commit(self.th)
@@ -1,11 +1,17 @@
 from ..defs import EXTS
 from ..state import ImageState, AppState
+from ..pipeline.imageio import read_shape
+from ..pipeline.mask import PackedMask
+from ..project import PROJECT_EXT, ProjectWriter, encode_entry, load_entry, read_manifest
+from ..runner import TaskRunner
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import os
+import time
+import weakref
 
 
 class LeftSidebar(tk.Frame):
@@ -35,20 +41,43 @@ class LeftSidebar(tk.Frame):
         self.is_collapsed = False
         self.expanded_width = width
         self.collapsed_width = 70
-        self._img_refs = [] 
+
+        # one _Row per ImageState, updated in place on refresh
+        self._rows = []
+        self._rows_collapsed = None
+        # id(ImageState) -> (weakref to ImageState, {stage: (weakref to array, PhotoImage)})
+        self._thumbs = {}
+
+        # files are decoded on a thread pool and added in selection order
+        self.loader = TaskRunner(self)
+        self._loaded = {}
+        self._next_loaded = 0
+        self._load_errors = []
+        self._load_problem_text = ""
+        self._last_flush = 0.0
 
         self._build_ui()
 
     
     def refresh(self):
-        self._update_header()
-        for w in self.inner.winfo_children(): w.destroy()
-        self._img_refs = []
-
-        for idx, img_st in enumerate(self.state.images):
-            self._add_row(idx, img_st)
+        if self._rows_collapsed != self.is_collapsed:
+            # layout changed, rows are rebuilt (thumbnails stay cached)
+            self._update_header()
+            for row in self._rows: row.frame.destroy()
+            self._rows = []
+            self._rows_collapsed = self.is_collapsed
+
+        self._sync_rows()
+
+        active = self.state.active()
+        for row in self._rows:
+            self._update_row(row, row.img_st is active)
     
 
+    def shutdown(self):
+        self.loader.shutdown()
+
+
     # ====================== UI ======================
 
     def _build_ui(self):
@@ -86,6 +115,40 @@ class LeftSidebar(tk.Frame):
         )
         self.btn_load.pack(side="right")
 
+        # Project Menu
+        self.btn_menu = tk.Button(
+            self.top_frame,
+            text="...",
+            relief="flat",
+            bg="#e6e6e6",
+            fg="#222",
+            cursor="hand2",
+            width=3
+        )
+        self.btn_menu.pack(side="right", padx=(0, 4))
+
+        self.menu_project = tk.Menu(self, tearoff=0)
+        self.menu_project.add_command(label="Open Project...", command=self._open_project)
+        self.menu_project.add_command(label="Save Project...", command=self._save_project)
+        self.btn_menu.bind("<Button-1>", lambda e: self.menu_project.post(e.x_root, e.y_root))
+
+        # loading progress, packed only while files are being decoded
+        self.frm_progress = tk.Frame(self, bg="#f2f2f2")
+
+        self.lbl_progress = tk.Label(self.frm_progress, text="", bg="#f2f2f2", fg="#444", anchor="w")
+        self.lbl_progress.pack(fill="x")
+
+        self.btn_cancel = tk.Button(
+            self.frm_progress, text="Cancel",
+            command=self.loader.cancel,
+            relief="flat", bg="#e0e0e0", fg="#555",
+            cursor="hand2"
+        )
+        self.btn_cancel.pack(side="right", padx=(4, 0))
+
+        self.pb_progress = ttk.Progressbar(self.frm_progress, orient="horizontal", mode="determinate")
+        self.pb_progress.pack(side="left", fill="x", expand=True)
+
         # Main Body (Scrollbar + Content)
         self.body_frame = tk.Frame(self, bg="#ffffff")
         self.body_frame.pack(fill="both", expand=True, padx=4, pady=4)
@@ -130,10 +193,12 @@ class LeftSidebar(tk.Frame):
         if self.is_collapsed:
             self.lbl_title.pack_forget()
             self.btn_load.pack_forget()
+            self.btn_menu.pack_forget()
             self.btn_toggle.config(text=">>")
         else:
             self.lbl_title.pack(side="left", padx=8)
             self.btn_load.pack(side="right")
+            self.btn_menu.pack(side="right", padx=(0, 4))
             self.btn_toggle.config(text="<<")
 
         if self.is_collapsed:
@@ -206,29 +271,186 @@ class LeftSidebar(tk.Frame):
 
 
     def _load_image(self, path: str):
-        ext = os.path.splitext(path)[1].lower()
-        if ext not in EXTS:
-            raise ValueError(f"Unsupported image format: {ext}")
-        
-        img = cv2.imread(path)
-        if img is None:
-            raise ValueError(f"Failed to load image: {path}")
-        
-        return img
+        # only the working-size image is decoded, the full resolution
+        # original is read when an export or overlay needs it
+        img_st = ImageState(path=path, filename=os.path.basename(path), shape=read_shape(path))
+        img_st.scaled_slot.get()
+        return img_st
 
 
     def _load_images(self):
+        if self.loader.busy: return
+
         paths = filedialog.askopenfilenames(title="Select Images", filetypes=[("Images", "*" + " *".join(EXTS))])
-        for path in paths:
+        if not paths: return
+
+        self._start_loading(paths, self._load_job, "could not be loaded")
+
+
+    def _start_loading(self, items, job, problem_text):
+        # job((index, item)) -> (ImageState or None, error or None)
+        self._loaded = {}
+        self._next_loaded = 0
+        self._load_errors = []
+        self._load_problem_text = problem_text
+        self.frm_progress.pack(fill="x", padx=4, before=self.body_frame)
+
+        self.loader.start(
+            list(enumerate(items)), job,
+            on_result=self._on_loaded,
+            on_progress=self._on_load_progress,
+            on_done=self._on_load_done
+        )
+
+
+    def _load_job(self, item):
+        # worker thread, must not touch Tk
+        _, path = item
+        try:
+            return self._load_image(path), None
+        except Exception as e:
+            return None, f"{os.path.basename(path)}: {e}"
+
+
+    def _on_loaded(self, item, result):
+        self._loaded[item[0]] = result
+
+
+    def _flush_loaded(self, partial=False):
+        # add the finished prefix in selection order with one notify,
+        # a cancelled run adds whatever finished
+        ready = []
+        while self._next_loaded in self._loaded:
+            ready.append(self._loaded.pop(self._next_loaded))
+            self._next_loaded += 1
+
+        if partial:
+            ready += [self._loaded.pop(i) for i in sorted(self._loaded)]
+
+        self._load_errors += [error for _, error in ready if error]
+        self.state.add_images([img_st for img_st, _ in ready if img_st is not None])
+
+
+    def _on_load_progress(self, done, total):
+        self.pb_progress.config(maximum=max(1, total), value=done)
+        self.lbl_progress.config(text=f"Loading {done}/{total}")
+
+        # a few panel rebuilds per second at most while loading
+        if time.monotonic() - self._last_flush >= 0.5:
+            self._flush_loaded()
+            self._last_flush = time.monotonic()
+
+
+    def _on_load_done(self, cancelled):
+        self.frm_progress.pack_forget()
+        self._flush_loaded(partial=cancelled)
+
+        if self._load_errors:
+            shown = self._load_errors[:15]
+            more = len(self._load_errors) - len(shown)
+            msg = "\n".join(shown) + (f"\n... and {more} more" if more else "")
+            messagebox.showerror("Load error", f"{len(self._load_errors)} file(s) {self._load_problem_text}:\n\n{msg}")
+            self._load_errors = []
+
+
+    # ====================== PROJECT ======================
+
+    def _open_project(self):
+        if self.loader.busy: return
+
+        path = filedialog.askopenfilename(title="Open Project", filetypes=[("MoldVision Project", "*" + PROJECT_EXT)])
+        if not path: return
+
+        try:
+            reader, entries = read_manifest(path)
+        except Exception as e:
+            messagebox.showerror("Open error", f"{os.path.basename(path)}: {e}")
+            return
+
+        if self.state.images:
+            replace = messagebox.askyesnocancel("Open Project", "Replace the current images?\n\nNo adds the project's images to them.")
+            if replace is None: return
+            if replace: self.state.clear_images()
+
+        project_dir = os.path.dirname(reader.path)
+        self._start_loading(
+            entries, lambda item: self._project_entry_job(reader, item[1], project_dir),
+            "need attention"
+        )
+
+
+    def _project_entry_job(self, reader, entry, project_dir):
+        # worker thread: stats the file and reads thumbnails and component
+        # stats, grayscale and masks stay in the project until used
+        try:
+            return load_entry(reader, entry, project_dir)
+        except Exception as e:
+            return None, f"{entry.get('filename', '?')}: {e}"
+
+
+    def _save_project(self):
+        if self.loader.busy or not self.state.images: return
+
+        path = filedialog.asksaveasfilename(
+            title="Save Project", defaultextension=PROJECT_EXT,
+            filetypes=[("MoldVision Project", "*" + PROJECT_EXT)]
+        )
+        if not path: return
+
+        try:
+            writer = ProjectWriter(path)
+        except OSError as e:
+            messagebox.showerror("Save error", str(e))
+            return
+
+        project_dir = os.path.dirname(writer.path)
+        errors = []
+
+        def on_result(item, result):
+            # members go into the file as they come, on the Tk thread
+            i, img_st = item
+            entry, members, error = result
+            if error:
+                errors.append(f"{img_st.filename}: {error}")
+                return
             try:
-                img = self._load_image(path)
-                state = ImageState(path=path, filename=os.path.basename(path), original=img)
-                self.state.add_image(state)
+                writer.add(entry, members, order=i)
             except Exception as e:
-                messagebox.showerror("Load error", str(e))
-        
-        if paths and self.state.images:
-            self.state.set_active(len(self.state.images) - 1)
+                errors.append(f"{img_st.filename}: {e}")
+
+        def on_progress(done, total):
+            self.pb_progress.config(maximum=max(1, total), value=done)
+            self.lbl_progress.config(text=f"Saving {done}/{total}")
+
+        def on_done(cancelled):
+            self.frm_progress.pack_forget()
+            if cancelled:
+                writer.abort()
+                return
+            try:
+                writer.close()
+            except Exception as e:
+                writer.abort()
+                errors.insert(0, str(e))
+            if errors:
+                shown = errors[:15]
+                more = len(errors) - len(shown)
+                msg = "\n".join(shown) + (f"\n... and {more} more" if more else "")
+                messagebox.showerror("Save error", f"{len(errors)} image(s) were not saved:\n\n{msg}")
+
+        self.frm_progress.pack(fill="x", padx=4, before=self.body_frame)
+        self.loader.start(
+            list(enumerate(self.state.images)), lambda item: self._save_job(item[1], project_dir),
+            on_result=on_result, on_progress=on_progress, on_done=on_done
+        )
+
+
+    def _save_job(self, img_st: ImageState, project_dir):
+        # worker thread, encoding releases the GIL
+        try:
+            return (*encode_entry(img_st, project_dir), None)
+        except Exception as e:
+            return None, None, e
 
 
     def _delete_all(self):
@@ -237,72 +459,171 @@ class LeftSidebar(tk.Frame):
                 self.state.clear_images()
 
 
-    def _add_row(self, index, img_st: ImageState):
-        is_active = (index == self.state.active_index)
-        bg = "#dfefff" if is_active else "#ffffff"
-        
-        row = tk.Frame(self.inner, bg=bg, pady=2, bd=0)
-        row.pack(fill="x", pady=1)
+    def _sync_rows(self):
+        images = self.state.images
+        alive = {id(img) for img in images}
+
+        kept = []
+        for row in self._rows:
+            if id(row.img_st) in alive:
+                kept.append(row)
+            else:
+                row.frame.destroy()
+
+        by_id = {id(row.img_st): row for row in kept}
+        added, rows = [], []
+        for img in images:
+            row = by_id.get(id(img))
+            if row is None:
+                row = self._add_row(img)
+                added.append(row)
+            rows.append(row)
+
+        # new rows pack at the end, repack only if that is not the image order
+        if rows != kept + added:
+            for row in rows: row.frame.pack_forget()
+            for row in rows: row.frame.pack(fill="x", pady=1)
+
+        self._rows = rows
+
+        for key in [k for k in self._thumbs if k not in alive]:
+            del self._thumbs[key]
+
+
+    def _add_row(self, img_st: ImageState):
+        row = _Row(img_st)
+        row.frame = tk.Frame(self.inner, bg=row.bg, pady=2, bd=0)
+        row.frame.pack(fill="x", pady=1)
+        row.tinted.append(row.frame)
+
+        select = lambda e, s=img_st: self._set_active(s)
         
         def make_cell(col, width=None):
-            f = tk.Frame(row, bg=bg, bd=0, highlightthickness=1, highlightbackground="#f0f0f0")
+            f = tk.Frame(row.frame, bg=row.bg, bd=0, highlightthickness=1, highlightbackground="#f0f0f0")
             if width:
                 f.configure(width=width)
                 f.pack_propagate(False)
             f.grid(row=0, column=col, sticky="nsew", padx=0, pady=0)
-            f.bind("<Button-1>", lambda e, i=index: self._set_active(i))
+            f.bind("<Button-1>", select)
+            row.tinted.append(f)
             return f
 
-        def add_icon(parent, img):
-            if img is not None:
-                try:
-                    thumb_bgr = cv2.resize(img, (32, 32))
-                    thumb_rgb = cv2.cvtColor(thumb_bgr, cv2.COLOR_BGR2RGB)
-                    thumb_pil = Image.fromarray(thumb_rgb)
-                    thumb_tk = ImageTk.PhotoImage(thumb_pil)
-                    self._img_refs.append(thumb_tk)
-                    lbl = tk.Label(parent, image=thumb_tk, bg=bg)
-                    lbl.pack(expand=True)
-                    lbl.bind("<Button-1>", lambda e, i=index: self._set_active(i))
-                except: pass
+        def add_icon(parent, stage):
+            lbl = tk.Label(parent, bg=row.bg)
+            lbl.pack(expand=True)
+            lbl.bind("<Button-1>", select)
+            row.tinted.append(lbl)
+            row.icons[stage] = lbl
 
         if self.is_collapsed:
-            row.grid_columnconfigure(0, weight=1)
+            row.frame.grid_columnconfigure(0, weight=1)
             c0 = make_cell(0)
-            add_icon(c0, img_st.original)
+            add_icon(c0, "original")
         else:
-            row.grid_columnconfigure(0, weight=1, uniform="cols") 
-            row.grid_columnconfigure(1, weight=1, uniform="cols") 
-            row.grid_columnconfigure(2, weight=1, uniform="cols")
-            row.grid_columnconfigure(3, weight=0, minsize=30) 
+            row.frame.grid_columnconfigure(0, weight=1, uniform="cols") 
+            row.frame.grid_columnconfigure(1, weight=1, uniform="cols") 
+            row.frame.grid_columnconfigure(2, weight=1, uniform="cols")
+            row.frame.grid_columnconfigure(3, weight=0, minsize=30) 
 
             c0 = make_cell(0)
-            f_icon = tk.Frame(c0, bg=bg)
+            f_icon = tk.Frame(c0, bg=row.bg)
             f_icon.pack(side="left", padx=2)
-            add_icon(f_icon, img_st.original)
+            row.tinted.append(f_icon)
+            add_icon(f_icon, "original")
             
-            lbl_name = tk.Label(c0, text=img_st.filename, bg=bg, fg="#222", anchor="w", font=("Segoe UI", 8))
+            lbl_name = tk.Label(c0, text=img_st.filename, bg=row.bg, fg="#222", anchor="w", font=("Segoe UI", 8))
             lbl_name.pack(side="left", fill="x", expand=True)
-            lbl_name.bind("<Button-1>", lambda e, i=index: self._set_active(i))
+            lbl_name.bind("<Button-1>", select)
+            row.tinted.append(lbl_name)
 
             c1 = make_cell(1)
-            add_icon(c1, img_st.preprocessed.img)
+            add_icon(c1, "preprocessed")
 
             c2 = make_cell(2)
-            add_icon(c2, img_st.detected)
+            add_icon(c2, "detected")
 
             c3 = make_cell(3)
-            btn_del = tk.Label(c3, text="x", bg=bg, fg="#999", cursor="hand2")
+            btn_del = tk.Label(c3, text="x", bg=row.bg, fg="#999", cursor="hand2")
             btn_del.pack(expand=True)
-            btn_del.bind("<Button-1>", lambda e, i=index: self._delete(i))
+            btn_del.bind("<Button-1>", lambda e, s=img_st: self._delete(s))
+            row.tinted.append(btn_del)
+
+        row.frame.bind("<Enter>", lambda e: row.frame.config(bg="#e8e8e8"))
+        row.frame.bind("<Leave>", lambda e: row.frame.config(bg=row.bg))
+        return row
+
+
+    def _update_row(self, row, is_active):
+        bg = "#dfefff" if is_active else "#ffffff"
+        if bg != row.bg:
+            row.bg = bg
+            for w in row.tinted: w.config(bg=bg)
+
+        # slots, not arrays: an unchanged row never pulls its images back
+        # out of the store
+        slots = {
+            "original": row.img_st.scaled_slot,
+            "preprocessed": row.img_st.preprocessed.slot,
+            "detected": row.img_st.detection.mask if row.img_st.detection else None,
+        }
+        for stage, lbl in row.icons.items():
+            slot = slots[stage]
+            if row.shown.get(stage) is slot: continue
+
+            thumb = self._thumbnail(row.img_st, stage, slot)
+            lbl.config(image=thumb if thumb is not None else "")
+            lbl.image = thumb
+            row.shown[stage] = slot
+
+
+    def _thumbnail(self, img_st: ImageState, stage, slot):
+        # slot is a StoredArray, or the PackedMask of the result column
+        if slot is None: return None
+        if not isinstance(slot, PackedMask) and not slot.present: return None
+
+        entry = self._thumbs.get(id(img_st))
+        if entry is None or entry[0]() is not img_st:
+            entry = (weakref.ref(img_st), {})
+            self._thumbs[id(img_st)] = entry
+
+        cached = entry[1].get(stage)
+        if cached is not None and cached[0]() is slot:
+            return cached[1]
+
+        try:
+            # an image opened from a project shows its saved icons until
+            # the stage is redone
+            thumb = img_st.saved.thumb(stage, slot) if img_st.saved is not None else None
+            if thumb is None:
+                thumb = img_st.thumbnail(stage, 32)
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB)
+            thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb))
+        except Exception:
+            return None
+
+        entry[1][stage] = (weakref.ref(slot), thumb_tk)
+        return thumb_tk
+
+
+    def _index_of(self, img_st: ImageState):
+        for i, img in enumerate(self.state.images):
+            if img is img_st: return i
+        return -1
+
 
-        row.bind("<Enter>", lambda e: row.config(bg="#e8e8e8"))
-        row.bind("<Leave>", lambda e: row.config(bg=bg))
+    def _set_active(self, img_st: ImageState):
+        self.state.set_active(self._index_of(img_st))
 
 
-    def _set_active(self, index):
-        self.state.set_active(index)
+    def _delete(self, img_st: ImageState):
+        self.state.remove_image(self._index_of(img_st))
 
 
-    def _delete(self, index):
-        self.state.remove_image(index)
\ No newline at end of file
+class _Row:
+    def __init__(self, img_st: ImageState):
+        self.img_st = img_st
+        self.bg = "#ffffff"
+        self.frame = None
+        self.tinted = []   # widgets that follow the highlight color
+        self.icons = {}    # stage -> Label
+        self.shown = {}    # stage -> array the icon was built from
@@ -1,9 +1,12 @@
 from ..state import AppState
+from ..pipeline.cache import LRUCache, StoredArray
+from ..pipeline.mask import overlay
 
 import tkinter as tk
 from tkinter import filedialog
 from PIL import Image, ImageTk
 import cv2
+import weakref
 
 
 class Portfolio(tk.Frame):
@@ -13,6 +16,9 @@ class Portfolio(tk.Frame):
         self.state = state
 
         self._img_refs = {} 
+        # (id(source), id(mask), width, height) -> (weakref to source,
+        # weakref to mask, PhotoImage), source is an array or a StoredArray
+        self._display_cache = LRUCache(max_entries=96)
         self._build_ui()
 
 
@@ -25,11 +31,14 @@ class Portfolio(tk.Frame):
         self.cv_res.delete("all")
         
         if img_st:
-            self._draw_image(self.cv_orig, img_st.original)
-            if img_st.preprocessed.img is not None:
-                self._draw_image(self.cv_pre, img_st.preprocessed.img)
-            if img_st.detected is not None:
-                self._draw_image(self.cv_res, img_st.detected)
+            # slots are drawn straight from the display cache when possible,
+            # stored arrays are only reloaded on a miss
+            self._draw_image(self.cv_orig, img_st.scaled_slot)
+            if img_st.preprocessed.ready:
+                self._draw_image(self.cv_pre, img_st.preprocessed.slot)
+            if img_st.detection is not None:
+                # overlay composited at display size from the packed mask
+                self._draw_image(self.cv_res, img_st.scaled_slot, mask=img_st.detection.mask)
 
         # Update Buttons
         if not self.state.images:
@@ -40,6 +49,12 @@ class Portfolio(tk.Frame):
             self.btn_next.config(state="normal" if active_idx < len(self.state.images) - 1 else "disabled")
 
 
+    def show_preview(self, img_bgr):
+        # transient result from the live preview, replaced on next refresh
+        self.cv_res.delete("all")
+        self._draw_image(self.cv_res, img_bgr, upscale=True, cache=False)
+
+
     # ====================== UI ====================== 
 
     def _build_ui(self):
@@ -111,23 +126,46 @@ class Portfolio(tk.Frame):
             self.state.set_active(min(len(self.state.images)-1, self.state.active_index + 1))
 
 
-    def _draw_image(self, canvas: tk.Canvas, img_bgr):
+    def _draw_image(self, canvas: tk.Canvas, img_bgr, upscale=False, cache=True, mask=None):
         if img_bgr is None: return
 
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        h, w = img_rgb.shape[:2]
+        shape = img_bgr.shape
+        if shape is None: return
+        h, w = shape[:2]
 
         cw = int(canvas.winfo_width())
         ch = int(canvas.winfo_height())
         if cw <= 1: cw = 1
         if ch <= 1: ch = 1
 
-        scale = min(cw / w, ch / h, 1.0)
-        nw, nh = int(w * scale), int(h * scale)
+        scale = min(cw / w, ch / h)
+        if not upscale:
+            scale = min(scale, 1.0)
+        nw, nh = max(1, int(w * scale)), max(1, int(h * scale))
 
-        img_resized = cv2.resize(img_rgb, (nw, nh), interpolation=cv2.INTER_AREA)
-        img_pil = Image.fromarray(img_resized)
-        img_tk = ImageTk.PhotoImage(img_pil)
+        key = (id(img_bgr), id(mask) if mask is not None else None, nw, nh)
+        cached = self._display_cache.get(key) if cache else None
+
+        if cached is not None and cached[0]() is img_bgr and (mask is None or cached[1]() is mask):
+            img_tk = cached[2]
+        else:
+            src = img_bgr.get() if isinstance(img_bgr, StoredArray) else img_bgr
+
+            # downscale first, color conversion then only touches display pixels
+            interp = cv2.INTER_AREA if scale <= 1.0 else cv2.INTER_LINEAR
+            img_resized = cv2.resize(src, (nw, nh), interpolation=interp)
+            if mask is not None:
+                img_resized = overlay(img_resized, mask.resized(nw, nh))
+            if img_resized.ndim == 3:
+                img_resized = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+
+            img_tk = ImageTk.PhotoImage(Image.fromarray(img_resized))
+            if cache:
+                self._display_cache.put(key, (
+                    weakref.ref(img_bgr),
+                    weakref.ref(mask) if mask is not None else None,
+                    img_tk
+                ))
 
         canvas.create_image(cw // 2, ch // 2, image=img_tk, anchor="center")
         self._img_refs[canvas] = img_tk 
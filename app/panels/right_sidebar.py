@@ -1,20 +1,43 @@
 from ..state import AppState, ImageState
-from ..defs import PreprocessParams, DetectParams, PREPROCESS_METHODS, DETECT_METHODS, TH_MODES
+from ..defs import PreprocessParams, DetectParams, ExportParams, PREPROCESS_METHODS, DETECT_METHODS, TH_MODES
+from ..export import export_image, output_stems
 from ..pipeline.processor import Processor
+from ..pipeline.trace import TRACE, export_chrome_trace
+from ..runner import TaskRunner
+from .histogram import HistogramPanel
+from .export_dialog import ExportDialog
 
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog, messagebox
+import copy
+import os
 
 DEF_PREPROCESS_PARAMS = PreprocessParams()
 DEF_DETECT_PARAMS = DetectParams()
 
 class RightSidebar(tk.Frame):
-    def __init__(self, parent, state: AppState, processor: Processor, width=340):
+    def __init__(self, parent, state: AppState, processor: Processor, width=340, on_preview=None):
         super().__init__(parent, width=width, bg="#f4f4f4")
         self.pack_propagate(False)
 
         self.state = state
         self.processor = processor
+        self.runner = TaskRunner(self)
+        self._batch_label = ""
+        self._batch_dirty = False
+        self.hist_panel = None
+        self._hist_job_id = None
+        # histogram data off the Tk thread, a newer request drops the stale one
+        self.hist_runner = TaskRunner(self, workers=1, poll_ms=10)
+
+        self.export_params = ExportParams()
+        self._export_folder = ""
+        self._export_errors = []
+
+        # live preview: one worker, a newer request drops the stale one
+        self.on_preview = on_preview
+        self.preview_runner = TaskRunner(self, workers=1, poll_ms=10)
+        self._preview_job_id = None
         
         self.state.add_listener(self._update_ui_state)
         
@@ -26,6 +49,17 @@ class RightSidebar(tk.Frame):
         self._update_ui_state()
 
 
+    def shutdown(self):
+        # pending debounced callbacks would fire into a destroyed root
+        for job_id in (self._preview_job_id, self._hist_job_id):
+            if job_id is not None: self.after_cancel(job_id)
+        self._preview_job_id = self._hist_job_id = None
+
+        self.runner.shutdown()
+        self.preview_runner.shutdown()
+        self.hist_runner.shutdown()
+
+
     # ====================== UI ====================== 
 
     def _build_ui(self):
@@ -118,12 +152,34 @@ class RightSidebar(tk.Frame):
         
         self.menu_actions = tk.Menu(self, tearoff=0)
         self.menu_actions.add_command(label="Auto Detect All", command=self._auto_detect_all)
+        self.menu_actions.add_command(label="Export All...", command=self._export_all)
+        self.menu_actions.add_separator()
+        self.trace_var = tk.BooleanVar(value=TRACE.enabled)
+        self.menu_actions.add_checkbutton(label="Record Stage Timings", variable=self.trace_var, command=self._on_trace_toggle)
+        self.menu_actions.add_command(label="Export Timing Trace...", command=self._export_trace)
         
         def show_menu(e):
             self.menu_actions.post(e.x_root, e.y_root)
         btn_menu.bind("<Button-1>", show_menu)
 
         btn_font = ("Segoe UI", 12, "bold")
+
+        # background batch progress, packed only while a batch runs
+        self.frm_progress = tk.Frame(frame, bg="#f4f4f4")
+
+        self.lbl_progress = tk.Label(self.frm_progress, text="", bg="#f4f4f4", fg="#444", anchor="w")
+        self.lbl_progress.pack(fill="x")
+
+        self.btn_cancel = tk.Button(
+            self.frm_progress, text="Cancel",
+            command=self.runner.cancel,
+            relief="flat", bg="#e0e0e0", fg="#555",
+            cursor="hand2"
+        )
+        self.btn_cancel.pack(side="right", padx=(4, 0))
+
+        self.pb_progress = ttk.Progressbar(self.frm_progress, orient="horizontal", mode="determinate")
+        self.pb_progress.pack(side="left", fill="x", expand=True)
         
         self.actions_container = tk.Frame(frame, bg="#f4f4f4")
         self.actions_container.pack(fill="x")
@@ -274,10 +330,17 @@ class RightSidebar(tk.Frame):
         for v in all_vars:
             v.trace_add("write", self._on_detect_change)
         
+        self.live_preview_var = tk.BooleanVar(value=False)
+        self.cbtn_live = tk.Checkbutton(
+            self.frm_controls, text="Live Preview (downscaled)", variable=self.live_preview_var,
+            bg="#f4f4f4", command=self._schedule_preview
+        )
+        self.cbtn_live.pack(anchor="w", padx=16, pady=4)
+
         self.btn_hist = tk.Button(
             self.frm_controls,
-            text="Plot Histogram",
-            command=self._plot_histogram,
+            text="Variance Histogram",
+            command=self._show_histogram,
             bg="#e0e0e0", 
             relief="flat",
             cursor="hand2"
@@ -300,6 +363,8 @@ class RightSidebar(tk.Frame):
         self.lbp_rad_var = tk.IntVar(value=DEF_DETECT_PARAMS.lbp_rad)
         self.lbp_points_var = tk.IntVar(value=DEF_DETECT_PARAMS.lbp_points)
         self.lbp_uniform_th_var = tk.DoubleVar(value=DEF_DETECT_PARAMS.lbp_uniform_th)
+        self.full_res_var = tk.BooleanVar(value=DEF_DETECT_PARAMS.full_res)
+        self.coarse_to_fine_var = tk.BooleanVar(value=DEF_DETECT_PARAMS.coarse_to_fine)
 
         # adaptive th method
         self.block_size_var = tk.IntVar(value=DEF_DETECT_PARAMS.block_size)
@@ -341,6 +406,18 @@ class RightSidebar(tk.Frame):
         self.sc_lbp_points = self._slider("LBP Points", self.lbp_points_var, 4, 32, parent=self.frm_lbp_opts)
         self.sc_lbp_th = self._slider("LBP Uniformity Th", self.lbp_uniform_th_var, 0.0, 1.0, step=0.01, parent=self.frm_lbp_opts)
 
+        self.cbtn_full_res = tk.Checkbutton(
+            self.frm_variance_opts, text="Full Resolution (tiled, slower)", variable=self.full_res_var,
+            bg="#f4f4f4", command=self._on_detect_change
+        )
+        self.cbtn_full_res.pack(anchor="w", padx=16, pady=4)
+
+        self.cbtn_coarse_to_fine = tk.Checkbutton(
+            self.frm_variance_opts, text="Refine Candidates Only (sparse mold, approximate; not Z-Score)", variable=self.coarse_to_fine_var,
+            bg="#f4f4f4", command=self._on_detect_change
+        )
+        self.cbtn_coarse_to_fine.pack(anchor="w", padx=32, pady=4)
+
         # -- Adaptive Vars --
         self.frm_adaptive_opts = tk.Frame(self.frm_detect_options, bg="#f4f4f4")
 
@@ -368,6 +445,7 @@ class RightSidebar(tk.Frame):
             self.th_mode_var, self.fixed_th_var, self.zk_var, self.percentile_var,
             self.min_area_var, self.max_area_var, #self.scales_var
             self.use_lbp_var, self.lbp_rad_var, self.lbp_points_var, self.lbp_uniform_th_var,
+            self.full_res_var, self.coarse_to_fine_var,
             self.block_size_var, self.c_var,
             self.edge_t1_var, self.edge_t2_var, self.edge_kernel_var, self.edge_density_th_var
         ]
@@ -446,6 +524,7 @@ class RightSidebar(tk.Frame):
 
         self._update_controls_state()
         self._update_info_label()
+        self._refresh_histogram()
 
 
     def _update_button_states(self):
@@ -469,7 +548,7 @@ class RightSidebar(tk.Frame):
         self._set_btn_state(self.btn_preprocess, True, "#2196f3")
         
         active_img = self._active()
-        if active_img and active_img.preprocessed.img is not None:
+        if active_img and active_img.preprocessed.ready:
             self._set_btn_state(self.btn_detect, True, "#4caf50")
         else:
             self._set_btn_state(self.btn_detect, False, "#4caf50")
@@ -494,7 +573,7 @@ class RightSidebar(tk.Frame):
             return # Skip unpacking inside if hidden
 
         active_img = self._active()
-        has_prep = (active_img is not None and active_img.preprocessed.img is not None)
+        has_prep = (active_img is not None and active_img.preprocessed.ready)
 
         # Preprocess State
         # Since we just hide everything if not custom, we can assume 'normal' here? 
@@ -597,10 +676,17 @@ class RightSidebar(tk.Frame):
         if self.custom_var.get():
             txt = f"Custom | Gray: {self.gray_method_var.get()} | Det: {self.method_var.get()}"
         else:
-            if img.preprocessed.img is not None:
+            if img.preprocessed.ready:
                 txt = getattr(img, 'auto_info', f"Auto Mode | Texture: {getattr(img.preprocessed, 'texture', '?')}")
             else:
                 txt = "Auto Detect Mode"
+
+        if img.detection is not None:
+            txt += f" | Blobs: {img.detection.components} | Coverage: {img.detection.affected_ratio:.1%}"
+
+        timing = TRACE.summary(img) if TRACE.enabled else ""
+        if timing:
+            txt += "\n" + timing
         
         self.lbl_info.config(text=txt)
 
@@ -617,6 +703,45 @@ class RightSidebar(tk.Frame):
         if img is None: return
         self._write_detect_params(img)
         self._update_controls_state()
+        if not self._updating_flag:
+            self._schedule_preview()
+
+
+    # ====================== LIVE PREVIEW ====================== 
+
+    def _schedule_preview(self, delay_ms=30):
+        # debounce: a burst of slider events starts one preview
+        if self._preview_job_id is not None:
+            self.after_cancel(self._preview_job_id)
+            self._preview_job_id = None
+
+        if not self.live_preview_var.get() or self.on_preview is None: return
+        self._preview_job_id = self.after(delay_ms, self._start_preview)
+
+
+    def _start_preview(self):
+        self._preview_job_id = None
+
+        img = self._active()
+        if img is None or not img.preprocessed.ready: return
+
+        # snapshot the params, the worker must not see later slider writes
+        work = self._work_copy(img)
+
+        self.preview_runner.start(
+            [work], self._preview_job,
+            on_result=lambda item, res: self._on_preview_result(img, res)
+        )
+
+
+    def _preview_job(self, work: ImageState):
+        return self.processor.detect_preview(work)
+
+
+    def _on_preview_result(self, img: ImageState, preview):
+        if preview is None or not self.live_preview_var.get(): return
+        if img is not self._active(): return
+        self.on_preview(preview)
 
 
     def _update_all_vars_from_model(self):
@@ -641,6 +766,8 @@ class RightSidebar(tk.Frame):
             self.lbp_rad_var.set(d.lbp_rad)
             self.lbp_points_var.set(d.lbp_points)
             self.lbp_uniform_th_var.set(d.lbp_uniform_th)
+            self.full_res_var.set(d.full_res)
+            self.coarse_to_fine_var.set(d.coarse_to_fine)
             self.min_area_var.set(d.min_area)
             self.max_area_var.set(d.max_area)
             self.elemsize_var.set(d.elemsize)
@@ -686,6 +813,8 @@ class RightSidebar(tk.Frame):
         d.lbp_rad = self.lbp_rad_var.get()
         d.lbp_points = self.lbp_points_var.get()
         d.lbp_uniform_th = self.lbp_uniform_th_var.get()
+        d.full_res = self.full_res_var.get()
+        d.coarse_to_fine = self.coarse_to_fine_var.get()
         d.min_area = self.min_area_var.get()
         d.max_area = self.max_area_var.get()
         d.elemsize = self.elemsize_var.get()
@@ -735,6 +864,8 @@ class RightSidebar(tk.Frame):
         self.lbp_rad_var.set(DEF_DETECT_PARAMS.lbp_rad)
         self.lbp_points_var.set(DEF_DETECT_PARAMS.lbp_points)
         self.lbp_uniform_th_var.set(DEF_DETECT_PARAMS.lbp_uniform_th)
+        self.full_res_var.set(DEF_DETECT_PARAMS.full_res)
+        self.coarse_to_fine_var.set(DEF_DETECT_PARAMS.coarse_to_fine)
         #self.scales_var.set("") # Default is None logic
         self.min_area_var.set(DEF_DETECT_PARAMS.min_area)
         self.max_area_var.set(DEF_DETECT_PARAMS.max_area)
@@ -760,18 +891,16 @@ class RightSidebar(tk.Frame):
 
     def _preprocess_all(self):
         for img in self.state.images:
-            self._run_preprocess(img)
-        self.state._notify()
+            self._write_preprocess_params(img)
+        self._start_batch("Preprocessing", self.state.images, self._preprocess_job)
 
 
     def _run_preprocess(self, img: ImageState):
         self._write_preprocess_params(img)
         if self.processor:
             try:
-                res, txt = self.processor.preprocess(img)
-                img.preprocessed.img = res
-                img.preprocessed.texture = txt
-                img.detected = None # Invalidate detection if re-processed
+                img.preprocessed = self.processor.preprocess(img)
+                img.detection = None # Invalidate detection if re-processed
             except Exception as e:
                 print(f"Preprocess Error: {e}")
 
@@ -779,13 +908,18 @@ class RightSidebar(tk.Frame):
     def _detect_active(self):
         img = self._active()
         if img is None: return
-        self._run_detect(img)
-        self.state._notify()
+        self._detect(img)
 
 
-    def _detect_all(self):
-        for img in self.state.images:
-            self._run_detect(img)
+    def _detect(self, img: ImageState):
+        # full res detection takes seconds on large images and runs on the
+        # runner, with the progress bar and Cancel; working res stays inline
+        self._write_detect_params(img)
+        if img.detect_params.full_res and img.preprocessed.ready:
+            self._start_batch("Detecting (full res)", [img], self._detect_job)
+            return
+
+        self._run_detect(img)
         self.state._notify()
 
 
@@ -796,23 +930,233 @@ class RightSidebar(tk.Frame):
     def _auto_detect_all(self):
         """Run auto detect (preprocess + detect) on all images"""
         for img in self.state.images:
-            self._run_preprocess(img)
-            self._run_detect(img)
-        self.state._notify()
+            self._write_preprocess_params(img)
+            self._write_detect_params(img)
+        self._start_batch("Auto detecting", self.state.images, self._auto_detect_job)
+
+
+    # ====================== BACKGROUND BATCH ====================== 
+
+    def _start_batch(self, label, images, job, on_result=None, on_done=None):
+        if self.runner.busy or not images: return
+
+        self._batch_label = label
+        self.frm_progress.pack(fill="x", pady=(0, 8), before=self.actions_container)
+
+        self.runner.start(
+            images, job,
+            on_result=on_result or self._on_batch_result,
+            on_progress=self._on_batch_progress,
+            on_done=on_done or self._on_batch_done
+        )
+
+
+    # jobs run on worker threads against a shallow copy, so cancelled
+    # or failed work never leaves a half-updated ImageState behind
+    def _work_copy(self, img: ImageState):
+        # params are snapshotted too, sliders keep editing the originals
+        work = copy.copy(img)
+        work.preprocess_params = copy.deepcopy(img.preprocess_params)
+        work.detect_params = copy.deepcopy(img.detect_params)
+        return work
+
+
+    def _preprocess_job(self, img: ImageState):
+        work = self._work_copy(img)
+        work.preprocessed = self.processor.preprocess(work)
+        work.detection = None # Invalidate detection if re-processed
+        return work
+
+
+    def _detect_job(self, img: ImageState):
+        work = self._work_copy(img)
+        work.detection = self.processor.detect(work)
+        return work
+
+
+    def _auto_detect_job(self, img: ImageState):
+        work = self._preprocess_job(img)
+        work.detection = self.processor.detect(work)
+        return work
+
+
+    def _on_batch_result(self, img: ImageState, work: ImageState):
+        if not any(i is img for i in self.state.images): return # removed meanwhile
+
+        img.preprocessed = work.preprocessed
+        img.detection = work.detection
+        img.info = work.info
+        self._batch_dirty = True
+
+
+    def _on_batch_progress(self, done, total):
+        self.pb_progress.config(maximum=max(1, total), value=done)
+        self.lbl_progress.config(text=f"{self._batch_label} {done}/{total}")
+
+        # one refresh per poll tick, not per image
+        if self._batch_dirty:
+            self._batch_dirty = False
+            self.state._notify()
+
+
+    def _on_batch_done(self, cancelled):
+        self.frm_progress.pack_forget()
+        if self._batch_dirty or cancelled:
+            self._batch_dirty = False
+            self.state._notify()
+
+
+    # ====================== EXPORT ====================== 
+
+    def _export_all(self):
+        if self.runner.busy or not self.state.images: return
+        ExportDialog(self.winfo_toplevel(), self.export_params, self._start_export, folder=self._export_folder)
+
+
+    def _start_export(self, params: ExportParams, folder):
+        self.export_params = params
+        self._export_folder = folder
+        self._export_errors = []
+
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            messagebox.showerror("Export error", str(e))
+            return
+
+        images = list(self.state.images)
+        items = list(zip(images, output_stems(images)))
+        self._start_batch(
+            "Exporting", items, lambda item: self._export_job(item, params, folder),
+            on_result=self._on_export_result, on_done=self._on_export_done
+        )
+
+
+    def _export_job(self, item, params: ExportParams, folder):
+        # worker thread, encoding releases the GIL
+        img, stem = item
+        try:
+            export_image(img, folder, params, stem)
+            return None
+        except Exception as e:
+            return f"{img.filename}: {e}"
+
+
+    def _on_export_result(self, item, error):
+        if error: self._export_errors.append(error)
+
+
+    def _on_export_done(self, cancelled):
+        self.frm_progress.pack_forget()
+        if self._export_errors:
+            shown = self._export_errors[:15]
+            more = len(self._export_errors) - len(shown)
+            msg = "\n".join(shown) + (f"\n... and {more} more" if more else "")
+            messagebox.showerror("Export error", f"{len(self._export_errors)} image(s) could not be exported:\n\n{msg}")
+            self._export_errors = []
+
+
+    # ====================== TIMING TRACE ====================== 
+
+    def _on_trace_toggle(self):
+        TRACE.enable(self.trace_var.get())
+        self._update_info_label()
+
+
+    def _export_trace(self):
+        events = list(TRACE.events)
+        if not events: return
+
+        path = filedialog.asksaveasfilename(
+            initialfile="moldvision_trace.json",
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json")]
+        )
+        if path:
+            export_chrome_trace(path, events)
+
+
+    # ====================== HISTOGRAM ====================== 
+
+    def _show_histogram(self):
+        if self.hist_panel is None or not self.hist_panel.winfo_exists():
+            self.hist_panel = HistogramPanel(
+                self.winfo_toplevel(),
+                on_threshold=self._on_hist_threshold,
+                on_commit=self._on_hist_commit
+            )
+        self.hist_panel.lift()
+        self._refresh_histogram()
+
+
+    def _refresh_histogram(self):
+        # only while the panel is open; the variance map is a cache hit
+        # after any detect, and a working-size pass on the worker otherwise
+        if self.hist_panel is None or not self.hist_panel.winfo_exists(): return
+
+        img = self._active()
+        if img is None:
+            self.hist_runner.cancel()
+            self.hist_panel.set_data(None, None)
+            return
+
+        self.hist_runner.start(
+            [self._work_copy(img)], self._hist_job,
+            on_result=lambda item, res: self._on_hist_result(img, item, res)
+        )
+
+
+    def _hist_job(self, work: ImageState):
+        return self.processor.variance_histogram(work)
+
+
+    def _on_hist_result(self, img: ImageState, work: ImageState, res):
+        if self.hist_panel is None or not self.hist_panel.winfo_exists(): return
+        if img is not self._active(): return
+
+        # full res detection thresholds its own map, the bars still come
+        # from the working image
+        title = img.filename
+        if work.detect_params.full_res: title += " (working res)"
+
+        hist, th = res
+        self.hist_panel.set_data(hist, th, title)
+
+
+    def _on_hist_threshold(self, value):
+        # a dragged threshold is a fixed one, the var traces write it to the
+        # params. The variance map is cached, so re-detecting at working
+        # size is cheap enough to follow the drag; full res waits for release
+        if self.th_mode_var.get() != "fixed":
+            self.th_mode_var.set("fixed")
+        self.fixed_th_var.set(int(value))
+
+        if self.full_res_var.get(): return
+        if self._hist_job_id is not None:
+            self.after_cancel(self._hist_job_id)
+        self._hist_job_id = self.after(30, self._hist_detect)
+
+
+    def _on_hist_commit(self, value):
+        self._hist_detect()
+
 
+    def _hist_detect(self):
+        if self._hist_job_id is not None:
+            self.after_cancel(self._hist_job_id)
+            self._hist_job_id = None
 
-    def _plot_histogram(self):
         img = self._active()
-        if img and self.processor:
-            self.processor.show_variance_histogram(img)
+        if img is None or not img.preprocessed.ready: return
+        self._detect(img)
 
     
     def _run_detect(self, img: ImageState):
-        if img.preprocessed.img is None: return 
+        if not img.preprocessed.ready: return 
         self._write_detect_params(img)
         if self.processor:
             try:        
-                img.detected = self.processor.detect(img)
+                img.detection = self.processor.detect(img)
             except Exception as e:
                 print(f"Detect Error: {e}")
                 # Print stack trace
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import itertools
+import threading
+
+
+def nbytes_of(value):
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    return int(getattr(value, "nbytes", 0))
+
+
+class LRUCache:
+    # Least-recently-used map bounded by entry count and, optionally, by the
+    # summed nbytes of the stored arrays. Safe to share between threads.
+
+    def __init__(self, max_entries=32, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items: return default
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+
+    def put(self, key, value):
+        size = nbytes_of(value)
+        # never cache something that alone blows the budget
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.discard(key)
+            return value
+
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+
+            self._items[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+        return value
+
+
+    def get_or_compute(self, key, fn):
+        # compute outside the lock, two threads may race on the same key
+        # but both produce the same value
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key][0]
+
+        return self.put(key, fn())
+
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+
+
+    def set_budget(self, max_bytes=None, max_entries=None):
+        with self._lock:
+            self.max_bytes = max_bytes
+            if max_entries is not None:
+                self.max_entries = max_entries
+            self._evict()
+
+
+    def discard_where(self, pred):
+        with self._lock:
+            for key in [k for k in self._items if pred(k)]:
+                self.nbytes -= self._items.pop(key)[1]
+
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+    def _evict(self):
+        while self._items and (
+            len(self._items) > self.max_entries
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self._items.popitem(last=False)
+            self.nbytes -= size
+
+
+class CacheView:
+    # One owner's namespace inside a shared LRUCache, so all owners compete
+    # for a single budget instead of each holding its own.
+
+    _tokens = itertools.count()
+
+    def __init__(self, shared: LRUCache):
+        self.shared = shared
+        self.token = next(self._tokens)
+
+
+    def __contains__(self, key):
+        return (self.token, key) in self.shared
+
+
+    def get(self, key, default=None):
+        return self.shared.get((self.token, key), default)
+
+
+    def put(self, key, value):
+        return self.shared.put((self.token, key), value)
+
+
+    def get_or_compute(self, key, fn):
+        return self.shared.get_or_compute((self.token, key), fn)
+
+
+    def discard(self, key):
+        self.shared.discard((self.token, key))
+
+
+    def clear(self):
+        self.shared.discard_where(lambda k: k[0] == self.token)
+
+
+class StoredArray:
+    # Handle to one array kept in a CacheView. With a loader the entry may be
+    # evicted and is rebuilt by the next get(); without a loader (or a key)
+    # the handle pins the array itself.
+
+    def __init__(self, view: CacheView | None, key, value=None, loader=None):
+        self.view = view
+        self.key = key
+        self.loader = loader
+        self._pinned = None
+        self._shape = None
+
+        if view is None or key is None or loader is None:
+            self._pinned = value if value is not None or loader is None else loader()
+            self.loader = None
+            value = self._pinned
+        elif value is not None:
+            view.put(key, value)
+
+        if value is not None:
+            self._shape = value.shape
+
+
+    @property
+    def present(self):
+        # available without saying whether it is resident right now
+        return self._pinned is not None or self.loader is not None
+
+
+    @property
+    def shape(self):
+        # known without a reload once the array has been seen
+        if self._shape is None: self.get()
+        return self._shape
+
+
+    def get(self):
+        if self.loader is None: return self._pinned
+
+        value = self.view.get_or_compute(self.key, self.loader)
+        if value is not None: self._shape = value.shape
+        return value
+
+
+    def peek(self):
+        # resident value or None, never loads
+        if self.loader is None: return self._pinned
+        return self.view.get(self.key)
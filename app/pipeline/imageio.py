@@ -0,0 +1,85 @@
+from ..defs import EXTS
+
+from PIL import Image
+import cv2
+import os
+
+
+# JPEG can be decoded straight at 1/2, 1/4 or 1/8 size (DCT scaling)
+JPEG_EXTS = (".jpg", ".jpeg")
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _check_ext(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXTS:
+        raise ValueError(f"Unsupported image format: {ext}")
+    return ext
+
+
+def load_image(path: str, reduce=1):
+    ext = _check_ext(path)
+
+    flag = REDUCED_FLAGS.get(reduce, cv2.IMREAD_COLOR) if ext in JPEG_EXTS else cv2.IMREAD_COLOR
+    img = cv2.imread(path, flag)
+    if img is None:
+        raise ValueError(f"Failed to load image: {path}")
+
+    return img
+
+
+def read_shape(path: str):
+    # (h, w, 3) as cv2.imread would return it, from the header only
+    _check_ext(path)
+    try:
+        with Image.open(path) as im:
+            w, h = im.size
+            # cv2 applies the EXIF orientation, 5..8 swap the axes
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                w, h = h, w
+    except Exception:
+        raise ValueError(f"Failed to load image: {path}")
+
+    return (h, w, 3)
+
+
+def fit_size(shape, max_dim):
+    # (w, h) of an image of `shape` scaled down to fit max_dim
+    h, w = shape[:2]
+    scale = min(max_dim / max(h, w), 1.0)
+    if scale >= 1.0: return w, h
+    return int(w * scale), int(h * scale)
+
+
+def reduction_for(shape, max_dim):
+    # largest decode reduction that still leaves at least max_dim pixels,
+    # the final resize is then always a downscale
+    side = max(shape[:2])
+    for f in (8, 4, 2):
+        if side // f >= max_dim: return f
+    return 1
+
+
+def scale_to_fit(img, max_dim, shape=None):
+    # resize to the size the full resolution `shape` scales to, so a reduced
+    # decode ends up with exactly the same dimensions as the full one
+    w, h = fit_size(shape if shape is not None else img.shape, max_dim)
+    if (w, h) == (img.shape[1], img.shape[0]): return img
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+
+
+def load_scaled(path: str, max_dim, shape=None):
+    if shape is None:
+        shape = read_shape(path)
+
+    img = load_image(path, reduction_for(shape, max_dim))
+
+    # header and decoder disagree on orientation, trust the pixels
+    if (img.shape[0] > img.shape[1]) != (shape[0] > shape[1]):
+        shape = (shape[1], shape[0], 3)
+
+    return scale_to_fit(img, max_dim, shape)
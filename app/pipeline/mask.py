@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+
+# overlay tint, same blend the old full frame addWeighted produced
+OVERLAY_ALPHA = 0.7
+OVERLAY_BGR = (0, 0, 255)
+
+
+class PackedMask:
+    # Binary mask, one bit per pixel, packed row by row so tiles starting on
+    # a multiple of 8 columns can be written and read on their own.
+
+    def __init__(self, mask: np.ndarray | None = None, shape=None, loader=None):
+        # with a loader (shape required) the bits are only read on first use
+        self._loader = None
+        if mask is not None:
+            self.shape = mask.shape[:2]
+            self._bits = np.packbits(mask > 0, axis=1)
+        elif loader is not None:
+            self.shape = tuple(shape[:2])
+            self._bits = None
+            self._loader = loader
+        else:
+            self.shape = tuple(shape[:2])
+            self._bits = np.zeros((self.shape[0], (self.shape[1] + 7) // 8), np.uint8)
+
+
+    @property
+    def bits(self):
+        if self._bits is None:
+            self._bits = self._loader()
+            self._loader = None
+        return self._bits
+
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * ((self.shape[1] + 7) // 8)
+
+
+    def unpack(self):
+        # uint8 0 / 255, like the masks the detectors return
+        return self.region(0, self.shape[0], 0, self.shape[1])
+
+
+    def region(self, y0, y1, x0, x1):
+        b0, b1 = x0 // 8, (x1 + 7) // 8
+        flat = np.unpackbits(self.bits[y0:y1, b0:b1], axis=1)
+        return flat[:, x0 - b0 * 8:x1 - b0 * 8] * np.uint8(255)
+
+
+    def write(self, y0, x0, mask: np.ndarray):
+        # x0 must be a multiple of 8, the tile may only end short of a
+        # byte at the right image border
+        h, w = mask.shape[:2]
+        self.bits[y0:y0 + h, x0 // 8:(x0 + w + 7) // 8] = np.packbits(mask > 0, axis=1)
+
+
+    def resized(self, width, height):
+        mask = self.unpack()
+        if (height, width) == self.shape: return mask
+        return cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def _blend_lut():
+    # per channel result of addWeighted(v, alpha, tint, 1 - alpha), so the
+    # blend is a single table lookup
+    levels = np.arange(256, dtype=np.uint8).reshape(1, 256, 1).repeat(3, axis=2)
+    tint = np.empty_like(levels)
+    tint[:] = OVERLAY_BGR
+    return cv2.addWeighted(levels, OVERLAY_ALPHA, tint, 1.0 - OVERLAY_ALPHA, 0)
+
+
+_BLEND_LUT = _blend_lut()
+
+
+def overlay(base: np.ndarray, mask: np.ndarray | None):
+    # red tint of `base` where mask is set; the mask is resized to base,
+    # only one full frame output is allocated
+    if base is None: return None
+
+    if base.ndim == 2:
+        base = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+    if mask is None: return base.copy()
+
+    oh, ow = base.shape[:2]
+    if mask.shape[:2] != (oh, ow):
+        mask = cv2.resize(mask, (ow, oh), interpolation=cv2.INTER_NEAREST)
+
+    out = cv2.LUT(base, _BLEND_LUT)
+    cv2.copyTo(base, cv2.compare(mask, 0, cv2.CMP_EQ), out)
+    return out
@@ -1,9 +1,16 @@
-from ..defs import PreprocessParams, DetectParams
-from ..state import ImageState
-
+from ..defs import PreprocessParams, DetectParams, AUTO_GRAY_SAMPLES, REFINE_TILE, REFINE_MAX_ACTIVE, REFINE_SAMPLE_EVERY, REFINE_SAMPLE_MIN
+from ..state import ImageState, PreprocessedImage
+from .mask import PackedMask, overlay
+from .result import DetectionResult, measure
+from .variance import VarianceEngine
+from .tiled import TileGrid, TiledComponents
+from .trace import TRACE, traced
+from . import threshold
+
+from dataclasses import replace
+import copy
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 try:
@@ -13,43 +20,108 @@ except:
     _HAS_SKIMG = False
 
 
+# 1x3 BGR weights of the linear grayscale methods, for cv2.transform
+_GRAY_WEIGHTS = {
+    "average": np.array([[1 / 3, 1 / 3, 1 / 3]], np.float32),
+    "luminosity": np.array([[0.07, 0.72, 0.21]], np.float32),
+}
+
+
 class Processor:
     def __init__(self):
         self.preprocess_params = PreprocessParams()
         self.detect_params = DetectParams()
     
 
+    @traced("preprocess", source=lambda self, st: st.scaled_slot.shape if st.original_slot.present else None)
     def preprocess(self, img_st: ImageState): 
-        img = img_st.original
-        if img is None: return
-
-        img = self._scale_img(img)
+        # stages: scale -> grayscale -> CLAHE -> texture, each memoized in
+        # img_st.cache under a key built from the params it depends on
+        if not img_st.original_slot.present: return
 
         if img_st.custom:
             method = img_st.preprocess_params.gray_method
         else:
-            method = self._auto_grayscale_stable(img)
+            method = self._stage(
+                img_st, ("auto_gray",), lambda: self._auto_grayscale_stable(self._scaled_stage(img_st)),
+                source=lambda: img_st.scaled_slot.shape
+            )
             
-        gray = self._to_grayscale(img, method)
+        key = ("gray", method)
 
         if img_st.preprocess_params.use_clahe:
-            grid = img_st.preprocess_params.clahe_grid
+            clip = float(img_st.preprocess_params.clahe_clip)
+            grid = int(img_st.preprocess_params.clahe_grid)
+            key = ("clahe", key, clip, grid)
+
+        current = img_st.preprocessed
+        if current is not None and current.ready and current.key == key:
+            # same params, e.g. opened from a project: nothing to redo
+            img_st.info = ""
+            return current
+
+        gray = self._gray_stage(img_st, key)
+
+        # the gray image stays in the store, evicted it is rebuilt from its key
+        pre = PreprocessedImage(
+            img=gray, key=key,
+            cache=img_st.cache, loader=lambda: self._gray_stage(img_st, key)
+        )
+        # its variance map stays behind for detection to start from
+        pre.texture = self._stage(img_st, ("texture", key), lambda: self._estimate_texture_level(gray, pre), source=lambda: gray)
+        img_st.info = ""
+        return pre
+
+
+    def _scaled_stage(self, st: ImageState):
+        # working-size image, decoded at reduced resolution when possible
+        return st.scaled
 
-            gray = self._apply_clahe(
-                gray, 
-                img_st.preprocess_params.clahe_clip,
-                (grid, grid)
+
+    def _gray_stage(self, st: ImageState, key):
+        # ("gray", method) or ("clahe", <gray key>, clip, grid)
+        if key[0] == "clahe":
+            _, base, clip, grid = key
+            return self._stage(
+                st, key, lambda: self._apply_clahe(self._gray_stage(st, base), clip, (grid, grid)),
+                source=lambda: st.scaled_slot.shape[:2]
             )
-        
-        texture = self._estimate_texture_level(gray)
-        img_st.info = ""
 
-        return gray, texture
+        return self._stage(st, key, lambda: self._to_grayscale(self._scaled_stage(st), key[1]), source=lambda: st.scaled_slot.shape)
         
 
+    @traced("detect", source=lambda self, st: self._detect_input(st))
     def detect(self, img_st: ImageState):
-        if img_st.preprocessed is None or img_st.preprocessed.img is None:
-            return None
+        # DetectionResult: bit-packed working resolution mask plus component
+        # stats; overlays are composited from it at whatever size they are
+        # shown or saved
+        if self._uses_full_res(img_st):
+            key = self._full_res_key(img_st)
+
+            # z-score bounds from a sample drift off the full frame ones
+            if img_st.detect_params.coarse_to_fine and img_st.detect_params.th_mode != "zscore":
+                img_st.info = "Variance-core (full res, coarse-to-fine)"
+                key = self._chain(key, "coarse_to_fine", img_st.detect_params.refine_margin)
+                return self._stage(img_st, key, lambda: self._detect_variance_coarse_to_fine(img_st), source=lambda: img_st.shape)
+
+            img_st.info = "Variance-core (full res, tiled)"
+            return self._stage(img_st, self._chain(key, "tiled"), lambda: self._detect_variance_tiled(img_st), source=lambda: img_st.shape)
+
+        mask, key = self._detect_staged(img_st)
+        if mask is None: return None
+
+        th = self._used_threshold(img_st)
+        return self._stage(img_st, self._chain(key, "result"), lambda: measure(mask, th), source=lambda: mask)
+    
+
+    def detect_mask(self, img_st: ImageState):
+        return self._detect_staged(img_st)[0]
+
+
+    def _detect_staged(self, img_st: ImageState):
+        # returns (mask, stage key of the mask)
+        if img_st.preprocessed is None or not img_st.preprocessed.ready:
+            return None, None
         
         if img_st.custom:
             method = img_st.detect_params.method
@@ -60,13 +132,105 @@ class Processor:
         return self._detect_variance_core(img_st)
     
 
-    def show_variance_histogram(self, img_st: ImageState):
-        gray = img_st.preprocessed.img
-        if gray is None: return
+    def _used_threshold(self, st: ImageState):
+        # a snapshot: the lambda below may run after the Tk thread has moved a slider
+        d = replace(st.detect_params)
+        method = d.method if st.custom else "variance"
+
+        if method in ("variance", "var_lbp"):
+            # a cache hit right after detection
+            var_map, key = self._variance_stage(st)
+            return self._stage(st, self._threshold_key(key, d), lambda: self._compute_threshold(var_map, d), source=lambda: var_map)
 
-        var_map = self._variance_multiscale(gray, scales=self._get_scales(img_st))
-        th = self._compute_threshold(var_map, img_st.detect_params)
-        self._plot_histogram(var_map, th)
+        if method == "adaptive":
+            return d.c
+
+        # edge density and saturation both threshold on edge_density_th
+        return d.edge_density_th
+
+
+    def _stage(self, st: ImageState, key, fn, source=None):
+        # only computed stages are traced, cache hits are not; source()
+        # gives the stage input whose shape the trace records
+        if TRACE.enabled: fn = TRACE.wrap(self._stage_name(key), st, fn, source)
+
+        # a preprocessed image built elsewhere has no key, run uncached
+        if key is None: return fn()
+        return st.cache.get_or_compute(key, fn)
+
+
+    def _detect_input(self, st: ImageState):
+        # shape of the image detection runs on, for the trace
+        if self._uses_full_res(st): return st.shape
+        # saturation reads the original (colour) image
+        if st.custom and st.detect_params.method == "saturation": return st.shape
+        pre = st.preprocessed
+        return pre.slot.shape if pre is not None and pre.ready else None
+
+
+    def _stage_name(self, key):
+        # ("gray", ...) roots and (parent, "var", ...) chains name themselves
+        if key is None: return "uncached"
+        return key[0] if isinstance(key[0], str) else key[1]
+
+
+    def _pre_key(self, st: ImageState):
+        # None when the preprocessed image did not come from preprocess()
+        return st.preprocessed.key or None
+
+
+    def _chain(self, key, *parts):
+        return None if key is None else (key, *parts)
+
+
+    @traced("detect_preview", source=lambda self, st: st.preprocessed.slot.shape if st.preprocessed else None)
+    def detect_preview(self, img_st: ImageState, max_dim=512):
+        # fast approximate detect on a downscaled proxy of the preprocessed
+        # image, spatial params are scaled along so the result looks alike
+        gray = img_st.preprocessed.img if img_st.preprocessed else None
+        if gray is None: return None
+
+        f = min(max_dim / max(gray.shape[:2]), 1.0)
+        pre_key = self._pre_key(img_st)
+
+        proxy = copy.copy(img_st)
+        if f < 1.0:
+            proxy.preprocessed = PreprocessedImage(
+                img=self._stage(img_st, self._chain(pre_key, "proxy", max_dim), lambda: self._scale_img(gray, max_dim), source=lambda: gray),
+                texture=img_st.preprocessed.texture,
+                key=self._chain(pre_key, "proxy", max_dim)
+            )
+
+            d = img_st.detect_params
+            proxy.detect_params = replace(
+                d,
+                scales=[self._scale_kernel(k, f) for k in self._get_scales(img_st)],
+                elemsize=self._scale_kernel(d.elemsize, f),
+                block_size=self._scale_kernel(d.block_size, f),
+                edge_kernel=self._scale_kernel(d.edge_kernel, f),
+            )
+
+        small = proxy.preprocessed.img
+        proxy.original = self._stage(
+            img_st, ("proxy_bgr", small.shape),
+            lambda: self._scale_img(img_st.scaled, max(small.shape[:2])), source=lambda: img_st.scaled_slot.shape
+        )
+
+        mask, _ = self._detect_staged(proxy)
+        if mask is None: return None
+        return self._apply_mask(proxy.original, mask)
+
+
+    def variance_histogram(self, img_st: ImageState):
+        # (256 counts of the uint8 variance map, current threshold); both
+        # come from the stages detection already memoized
+        if img_st.preprocessed is None or not img_st.preprocessed.ready: return None, None
+
+        var_map, key = self._variance_stage(img_st)
+        hist = self._stage(img_st, self._chain(key, "hist"), lambda: threshold.histogram_u8(var_map), source=lambda: var_map)
+        d = replace(img_st.detect_params)
+        th = self._stage(img_st, self._threshold_key(key, d), lambda: self._compute_threshold(var_map, d), source=lambda: var_map)
+        return hist, th
 
     
     def _apply_clahe(self, gray: np.ndarray, clip=2.0, tile_grid=(8, 8)):
@@ -75,20 +239,8 @@ class Processor:
     
 
     def _compute_threshold(self, var_map_u8: np.ndarray, params: DetectParams):
-        if params.th_mode == "fixed":
-            return params.fixed_th
-
-        if params.th_mode == "zscore":
-            x = var_map_u8.astype(np.float32)
-            med = np.median(x)
-            mad = np.median(np.abs(x - med)) + 1e-6
-            # 1.4826 * MAD approximates std for normal distribution
-            robust_std = 1.4826 * mad
-            return float(med + params.z_k * robust_std)
-
-        p = max(50.0, min(99.5, params.percentile))
-
-        return float(np.percentile(var_map_u8, p))
+        # single 256-bin histogram instead of sorting the map
+        return threshold.compute_threshold(var_map_u8, params)
     
 
     def _dispatch_manual_detect(self, st: ImageState, m: str):
@@ -108,9 +260,15 @@ class Processor:
     
 
     def _auto_grayscale_stable(self, bgr: np.ndarray):
+        # mean HSV saturation of a nearest-neighbour thumbnail, within one
+        # level of the full frame mean on our images at a fraction of the cost
+        h, w = bgr.shape[:2]
+        f = min(1.0, np.sqrt(AUTO_GRAY_SAMPLES / (h * w)))
+        if f < 1.0:
+            bgr = cv2.resize(bgr, (max(1, round(w * f)), max(1, round(h * f))), interpolation=cv2.INTER_NEAREST)
+
         hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-        s = hsv[:, :, 1]
-        mean_s = float(np.mean(s))
+        mean_s = float(np.mean(hsv[:, :, 1]))
 
         # clearly colored surface, often preserves contrast better
         if mean_s > 60: return "weighted"
@@ -119,56 +277,302 @@ class Processor:
         return "luminosity"
     
 
-    def _to_grayscale(self, img, method="weighted"):  
-        b, g, r = cv2.split(img)
-
+    def _to_grayscale(self, img, method="weighted"):
+        # one pass straight into the uint8 output, no channel copies or
+        # float temporaries
         if method == "weighted":
             return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        if method == "average":
-            return ((r + g + b) / 3).astype(np.uint8)
-        
-        if method == "max":
-            return np.maximum(np.maximum(r, g), b)
-        
-        if method == "min":
-            return np.minimum(np.minimum(r, g), b)
-        
-        if method == "luminosity":
-            return (0.21 * r + 0.72 * g + 0.07 * b).astype(np.uint8)
-        
+
+        if method in _GRAY_WEIGHTS:
+            # rounded and saturated like cvtColor
+            return cv2.transform(img, _GRAY_WEIGHTS[method]).reshape(img.shape[:2])
+
+        if method in ("max", "min"):
+            reduce = np.maximum if method == "max" else np.minimum
+            out = reduce(img[..., 0], img[..., 1])
+            return reduce(out, img[..., 2], out=out)
+
         raise ValueError(f"Unknown method: {method}")
     
 
+    def _variance_stage(self, st: ImageState):
+        gray = st.preprocessed.img
+        scales = tuple(self._get_scales(st))
+        key = self._chain(self._pre_key(st), "var", scales)
+
+        var_map = self._stage(st, key, lambda: self._variance_multiscale(gray, scales=scales, pre=st.preprocessed), source=lambda: gray)
+        return var_map, key
+
+
+    def _threshold_key(self, var_key, params: DetectParams):
+        # only the parameter of the active mode takes part in the key
+        if params.th_mode == "fixed":
+            return self._chain(var_key, "th", "fixed", params.fixed_th)
+        if params.th_mode == "zscore":
+            return self._chain(var_key, "th", "zscore", params.z_k)
+        return self._chain(var_key, "th", "percentile", params.percentile)
+
+
     def _detect_variance_core(self, st: ImageState):
         gray = st.preprocessed.img
-        if gray is None: return None
+        if gray is None: return None, None
 
-        params = st.detect_params
+        # keys and the lambdas computing under them read this one snapshot
+        params = replace(st.detect_params)
 
         # multi-scale var map
-        scales = self._get_scales(st)
-        var_map = self._variance_multiscale(gray, scales=scales)
+        var_map, key = self._variance_stage(st)
 
         # robust th.ing on var map
-        th = self._compute_threshold(var_map, params)
+        key = self._threshold_key(key, params)
+        th = self._stage(st, key, lambda: self._compute_threshold(var_map, params), source=lambda: var_map)
 
-        mask = (var_map > th).astype(np.uint8) * 255
-        mask = self._filter_components_by_area(mask, params.min_area, params.max_area)
+        key = self._chain(key, "area", params.min_area, params.max_area)
+        mask = self._stage(st, key, lambda: self._filter_components_by_area(
+            (var_map > th).astype(np.uint8) * 255, params.min_area, params.max_area
+        ), source=lambda: var_map)
 
         # optional -- LBP-uniformity filter (candidate validation)
-        if params.use_lbp:
-            mask = self._refine_with_lbp(gray, mask, params)
+        if params.use_lbp and _HAS_SKIMG:
+            # the LBP image only depends on the gray image, reuse it across thresholds
+            uniform = self._stage(
+                st, self._chain(self._pre_key(st), "lbp_uniform", params.lbp_points, params.lbp_rad),
+                lambda: self._lbp_uniform(gray, params.lbp_points, params.lbp_rad), source=lambda: gray
+            )
 
-        # morphology
-        mask = self._morph_refine(mask, params.elemsize, params.open_iter, params.close_iter)
+            area_mask = mask
+            key = self._chain(key, "lbp", params.lbp_rad, params.lbp_points, params.lbp_uniform_th)
+            mask = self._stage(st, key, lambda: self._refine_with_lbp(gray, area_mask, params, uniform), source=lambda: area_mask)
 
-        return self._apply_mask(st.original, mask)
+        # morphology
+        return self._morph_stage(st, key, mask, params.elemsize, params.open_iter, params.close_iter)
     
 
+    # ====================== FULL RES (TILED) ======================
+
+    def _uses_full_res(self, st: ImageState):
+        d = st.detect_params
+        if not d.full_res or st.preprocessed is None or not st.preprocessed.ready: return False
+        # the full res gray is rebuilt from the stage key of the working one
+        if self._pre_key(st) is None: return False
+        return not st.custom or d.method in ("variance", "var_lbp")
+
+
+    def _full_res_key(self, st: ImageState):
+        d = st.detect_params
+        key = self._chain(self._pre_key(st), "full_res", tuple(self._get_scales(st)), TileGrid((1, 1), d.tile_size).tile)
+        key = self._threshold_key(key, d)
+        key = self._chain(key, "area", d.min_area, d.max_area)
+        if d.use_lbp and _HAS_SKIMG:
+            key = self._chain(key, "lbp", d.lbp_rad, d.lbp_points, d.lbp_uniform_th)
+        return self._chain(key, "morph", d.elemsize, d.open_iter, d.close_iter)
+
+
+    def _full_gray(self, st: ImageState, key):
+        # same conversion as _gray_stage, on the original (not memoized)
+        if key[0] == "clahe":
+            _, base, clip, grid = key
+            return self._apply_clahe(self._full_gray(st, base), clip, (grid, grid))
+        return self._to_grayscale(st.original, key[1])
+
+
+    def _detect_variance_tiled(self, st: ImageState):
+        # _detect_variance_core on the full resolution gray image. Every
+        # per-pixel step runs on one tile plus a halo wide enough that the
+        # tile core comes out exactly as in a full frame run; normalization
+        # bounds and the threshold come from histograms summed over earlier
+        # passes, components are merged across tiles. Working memory is
+        # bounded by the tile size, only the gray image and the packed masks
+        # are image sized.
+        gray = self._full_gray(st, self._pre_key(st))
+        grid = TileGrid(gray.shape, st.detect_params.tile_size)
+
+        def window(y0, y1, x0, x1):
+            return gray[y0:y1, x0:x1]
+
+        lo, hi, th = self._tiled_threshold(st, grid, window, [(core, 1) for _, core in grid])
+        return self._tiled_detect(st, grid, window, dict(grid), lo, hi, th)
+
+
+    def _tile_variance(self, st: ImageState, grid: TileGrid, window, core):
+        # combined variance of one tile core, window(y0, y1, x0, x1) gives
+        # the gray pixels around it
+        scales = self._get_scales(st)
+        (y0, y1, x0, x1), inner = grid.window(core, max(scales) // 2)
+        engine = VarianceEngine(window(y0, y1, x0, x1), max_scale=max(scales))
+        return engine.max_variance(scales)[inner]
+
+
+    def _tiled_threshold(self, st: ImageState, grid: TileGrid, window, parts):
+        # normalization bounds and threshold from histograms summed over
+        # (tile core, weight) parts, one pass for each
+        params = st.detect_params
+
+        hist = np.zeros(threshold.VAR_BINS)
+        for core, weight in parts:
+            hist += weight * threshold.float_histogram(self._tile_variance(st, grid, window, core))
+        lo, hi = threshold.percentiles_from_float_hist(hist, (1.0, 99.5))
+
+        if params.th_mode == "fixed":
+            return lo, hi, params.fixed_th
+
+        hist_u8 = np.zeros(256)
+        for core, weight in parts:
+            var = threshold.normalize_clipped_u8(self._tile_variance(st, grid, window, core), lo, hi)
+            hist_u8 += weight * threshold.histogram_u8(var)
+        return lo, hi, threshold.compute_threshold(None, params, hist=hist_u8)
+
+
+    def _tiled_detect(self, st: ImageState, grid: TileGrid, window, tiles, lo, hi, th):
+        # threshold, filter and morphology on the given tiles (index -> core),
+        # every other tile comes out empty
+        params = st.detect_params
+        h, w = grid.shape
+        use_lbp = params.use_lbp and _HAS_SKIMG
+
+        # label the thresholded mask, count LBP-uniform pixels per label
+        raw = PackedMask(shape=grid.shape)
+        comps = TiledComponents(grid)
+        for index, core in tiles.items():
+            var = threshold.normalize_clipped_u8(self._tile_variance(st, grid, window, core), lo, hi)
+            mask = (var > th).astype(np.uint8) * 255
+            raw.write(core[0], core[2], mask)
+
+            uniform = None
+            if use_lbp:
+                win, inner = grid.window(core, int(np.ceil(params.lbp_rad)) + 1)
+                uniform = self._lbp_uniform(window(*win), params.lbp_points, params.lbp_rad)[inner]
+
+            comps.add(index, core, mask, weights=uniform)
+        comps.resolve()
+
+        # area filter, then the LBP uniformity filter, on the merged components
+        areas, _, _, uniform_counts = comps.components()
+        keep = (areas >= params.min_area * h * w) & (areas <= params.max_area * h * w)
+        if use_lbp:
+            keep &= uniform_counts / np.maximum(areas, 1) <= params.lbp_uniform_th
+        keep = np.where(keep, 255, 0).astype(np.uint8)
+
+        filtered = PackedMask(shape=grid.shape)
+        for index, core in tiles.items():
+            labels = cv2.connectedComponentsWithStats(raw.region(*core), connectivity=8)[1]
+            filtered.write(core[0], core[2], comps.lut(index, keep)[labels])
+
+        # morphology, the halo covers every erode / dilate step; closing can
+        # reach into the neighbours of the given tiles
+        elemsize = max(3, int(params.elemsize)) | 1
+        reach = (elemsize // 2) * 2 * (max(0, params.open_iter) + max(0, params.close_iter))
+
+        out = PackedMask(shape=grid.shape)
+        final = TiledComponents(grid)
+        for index, core in grid.around(tiles).items():
+            win, inner = grid.window(core, reach)
+            mask = self._morph_refine(filtered.region(*win), params.elemsize, params.open_iter, params.close_iter)[inner]
+            out.write(core[0], core[2], mask)
+            final.add(index, core, np.ascontiguousarray(mask))
+        final.resolve()
+
+        areas, bboxes, centroids, _ = final.components()
+        return DetectionResult(
+            mask=out,
+            threshold=float(th),
+            components=final.num,
+            areas=areas,
+            bboxes=bboxes,
+            centroids=centroids,
+            affected_ratio=float(areas.sum()) / float(h * w),
+        )
+
+
+    def _detect_variance_coarse_to_fine(self, st: ImageState):
+        # The tiled pipeline on REFINE_TILE tiles, run only on those within
+        # refine_margin of a candidate component found on the working image;
+        # the rest come out empty. Normalization bounds and the threshold are
+        # estimated: exact on the candidate tiles, where the high variance
+        # tail is, from a strided sample of the other tiles. Candidates
+        # covering more than REFINE_MAX_ACTIVE of the tiles leave nothing to
+        # skip, the exact tiled run takes over then.
+        params = st.detect_params
+        key = self._pre_key(st)
+
+        if key[0] == "gray":
+            # gray tiles straight from the original, no full frame gray
+            original = st.original
+
+            def window(y0, y1, x0, x1):
+                return self._to_grayscale(original[y0:y1, x0:x1], key[1])
+        else:
+            # CLAHE tiles depend on the whole image
+            gray = self._full_gray(st, key)
+
+            def window(y0, y1, x0, x1):
+                return gray[y0:y1, x0:x1]
+
+        h, w = st.shape[:2]
+        grid = TileGrid((h, w), REFINE_TILE)
+
+        # candidates: the working image variance (kernels scaled down by the
+        # resolution ratio) cut where twice the expected fraction above the
+        # threshold lies, so they err on the large side
+        work = st.preprocessed.img
+        f = max(w / work.shape[1], h / work.shape[0])
+
+        coarse = copy.copy(st)
+        coarse.detect_params = replace(params, scales=[self._scale_kernel(k, 1.0 / f) for k in self._get_scales(st)])
+        var_map, _ = self._variance_stage(coarse)
+
+        if params.th_mode == "fixed":
+            above = float((var_map > params.fixed_th).mean())
+        else:
+            above = 1.0 - max(50.0, min(99.5, params.percentile)) / 100.0
+
+        coarse_th = threshold.percentile_u8(var_map, 100.0 * (1.0 - min(1.0, 2.0 * above)))
+        candidates = self._filter_components_by_area(
+            (var_map > coarse_th).astype(np.uint8) * 255, params.min_area / 2, 1.0
+        )
+        active = self._refine_tiles(candidates, f, params.refine_margin, grid)
+
+        if len(active) > REFINE_MAX_ACTIVE * len(grid):
+            st.info = "Variance-core (full res, tiled: candidates everywhere)"
+            return self._detect_variance_tiled(st)
+
+        # every tile stands for the whole set it was drawn from
+        rest = [core for index, core in grid if index not in active]
+        every = max(1, min(REFINE_SAMPLE_EVERY, len(rest) // REFINE_SAMPLE_MIN))
+        sampled = rest[::every]
+        parts = [(core, 1) for core in active.values()]
+        parts += [(core, len(rest) / len(sampled)) for core in sampled]
+
+        lo, hi, th = self._tiled_threshold(st, grid, window, parts)
+        return self._tiled_detect(st, grid, window, active, lo, hi, th)
+
+
+    def _refine_tiles(self, coarse_mask: np.ndarray, f, margin, grid: TileGrid):
+        # tiles (index -> core) within margin full res pixels of a coarse
+        # mask pixel, looked up on the coarse mask grown by the margin
+        r = int(np.ceil(margin / f))
+        if r > 0:
+            coarse_mask = cv2.dilate(coarse_mask, cv2.getStructuringElement(cv2.MORPH_RECT, (2 * r + 1, 2 * r + 1)))
+
+        ch, cw = coarse_mask.shape[:2]
+        active = {}
+        for index, (y0, y1, x0, x1) in grid:
+            cy0, cy1 = min(ch - 1, int(y0 / f)), min(ch, int(np.ceil(y1 / f)))
+            cx0, cx1 = min(cw - 1, int(x0 / f)), min(cw, int(np.ceil(x1 / f)))
+            if coarse_mask[cy0:cy1, cx0:cx1].any():
+                active[index] = (y0, y1, x0, x1)
+        return active
+
+
+    def _morph_stage(self, st: ImageState, key, mask, elemsize, open_iter, close_iter):
+        key = self._chain(key, "morph", elemsize, open_iter, close_iter)
+        mask = self._stage(st, key, lambda: self._morph_refine(mask, elemsize, open_iter, close_iter), source=lambda: mask)
+        return mask, key
+
+
     def _detect_adaptive(self, img_st: ImageState):
         gray = img_st.preprocessed.img
-        if gray is None: return
+        if gray is None: return None, None
 
         # consider enabling clahe when using this
         block = img_st.detect_params.block_size
@@ -177,25 +581,25 @@ class Processor:
         if block % 2 == 0:
             block += 1
 
-        mask = cv2.adaptiveThreshold(
+        c = img_st.detect_params.c
+        key = self._chain(self._pre_key(img_st), "adaptive", block, c)
+        mask = self._stage(img_st, key, lambda: cv2.adaptiveThreshold(
             gray,
             255,
             cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
             cv2.THRESH_BINARY_INV,
             blockSize=block,
-            C=img_st.detect_params.c
-        )
+            C=c
+        ), source=lambda: gray)
         
-        mask = self._morph_refine(mask, img_st.detect_params.elemsize, open_iter=1, close_iter=1)
-
-        return self._apply_mask(img_st.original, mask)
+        return self._morph_stage(img_st, key, mask, img_st.detect_params.elemsize, 1, 1)
 
 
     def _detect_edge_density(self, img_st: ImageState):
         gray = img_st.preprocessed.img
-        if gray is None: return
+        if gray is None: return None, None
 
-        edges = cv2.Canny(gray, img_st.detect_params.edge_t1, img_st.detect_params.edge_t2)
+        t1, t2 = img_st.detect_params.edge_t1, img_st.detect_params.edge_t2
 
         k = img_st.detect_params.edge_kernel
         if k < 3:
@@ -203,31 +607,41 @@ class Processor:
         if k % 2 == 0:
             k += 1
 
-        kernel = np.ones((k, k), np.uint8)
-        density = cv2.filter2D(edges.astype(np.float32), -1, kernel)
-
         th = img_st.detect_params.edge_density_th
-        _, mask = cv2.threshold(density, th, 255, cv2.THRESH_BINARY)
 
-        mask = mask.astype(np.uint8)
-        mask = self._morph_refine(mask, img_st.detect_params.elemsize, open_iter=1, close_iter=1)
+        def compute():
+            edges = cv2.Canny(gray, t1, t2)
+
+            kernel = np.ones((k, k), np.uint8)
+            density = cv2.filter2D(edges.astype(np.float32), -1, kernel)
+
+            _, mask = cv2.threshold(density, th, 255, cv2.THRESH_BINARY)
+            return mask.astype(np.uint8)
+
+        key = self._chain(self._pre_key(img_st), "edge", t1, t2, k, th)
+        mask = self._stage(img_st, key, compute, source=lambda: gray)
 
-        return self._apply_mask(img_st.original, mask)
+        return self._morph_stage(img_st, key, mask, img_st.detect_params.elemsize, 1, 1)
 
 
     def _detect_saturation(self, img_st: ImageState):
         img = img_st.original
-        if img is None: return
-
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        s = hsv[:, :, 1]
+        if img is None: return None, None
 
         th = img_st.detect_params.edge_density_th
-        _, mask = cv2.threshold(s, th, 255, cv2.THRESH_BINARY_INV)
 
-        mask = self._morph_refine(mask, img_st.detect_params.elemsize, open_iter=1, close_iter=1)
+        def compute():
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            s = hsv[:, :, 1]
+
+            _, mask = cv2.threshold(s, th, 255, cv2.THRESH_BINARY_INV)
+            return mask
+
+        # works on the original, independent of preprocessing
+        key = ("saturation", img.shape, th)
+        mask = self._stage(img_st, key, compute, source=lambda: img)
 
-        return self._apply_mask(img_st.original, mask)
+        return self._morph_stage(img_st, key, mask, img_st.detect_params.elemsize, 1, 1)
     
 
     def _get_scales(self, st: ImageState):
@@ -255,27 +669,34 @@ class Processor:
         return [9, 15, 21]
     
 
-    def _variance_multiscale(self, gray: np.ndarray, scales, normalize=True):
-        gray_f = gray.astype(np.float32)
-        combined = None
+    def _scale_kernel(self, k, f):
+        k = max(3, int(round(k * f)))
+        return k if k % 2 == 1 else k + 1
 
-        for k in scales:
-            mean = cv2.boxFilter(gray_f, ddepth=-1, ksize=(k, k), normalize=True)
-            sq_mean = cv2.boxFilter(gray_f * gray_f, ddepth=-1, ksize=(k, k), normalize=True)
-            var = sq_mean - mean * mean
-            if combined is None:
-                combined = var
-            else:
-                combined = np.maximum(combined, var)
+
+    def _variance_multiscale(self, gray: np.ndarray, scales, normalize=True, pre: PreprocessedImage | None = None):
+        # with `pre` (the PreprocessedImage of `gray`) the raw map of every
+        # scale and the bounds per scale set are shared between texture
+        # estimation and detection, so no window is box filtered twice.
+        # The maps live in the store under its byte budget; the engine and
+        # its integral images (a few ms to rebuild) only live for this call
+        engine = VarianceEngine(gray, max_scale=max(scales))
+        if pre is not None:
+            for k in scales:
+                var = pre.variance(k)
+                if var is not None: engine.seed(k, var)
+
+        combined = engine.max_variance(scales)
+        if pre is not None:
+            for k in scales: pre.keep_variance(k, engine.variance(k))
 
         if not normalize: return combined
 
-        hi = np.percentile(combined, 99.5)
-        lo = np.percentile(combined, 1.0)
-        clipped = np.clip(combined, lo, hi)
+        bounds = pre.var_bounds.get(tuple(scales)) if pre is not None else None
+        lo, hi = bounds or threshold.float_percentiles(combined, (1.0, 99.5))
+        if pre is not None: pre.var_bounds[tuple(scales)] = (lo, hi)
 
-        norm = cv2.normalize(clipped, None, 0, 255, cv2.NORM_MINMAX)
-        return norm.astype(np.uint8)
+        return threshold.normalize_clipped_u8(combined, lo, hi)
     
 
     def _filter_components_by_area(self, mask: np.ndarray, min_ratio: float, max_ratio: float):
@@ -284,42 +705,47 @@ class Processor:
         h, w = mask.shape[:2]
         img_area = float(h * w)
 
-        out = np.zeros_like(mask)
-        for i in range(1, num):
-            area = float(stats[i, cv2.CC_STAT_AREA])
-            if area < min_ratio * img_area:
-                continue
-            if area > max_ratio * img_area:
-                continue
-            out[labels == i] = 255
+        # keep-table over labels, then a single lookup instead of one pass per label
+        areas = stats[:, cv2.CC_STAT_AREA].astype(np.float64)
+        keep = (areas >= min_ratio * img_area) & (areas <= max_ratio * img_area)
+        keep[0] = False # background
 
-        return out
+        lut = np.where(keep, 255, 0).astype(mask.dtype)
+        return lut[labels]
     
 
-    def _refine_with_lbp(self, gray: np.ndarray, mask: np.ndarray, params: DetectParams):
+    def _lbp_uniform(self, gray: np.ndarray, points, radius):
+        # In 'uniform' LBP, uniform patterns are <= p, non-uniform are > p
+        return local_binary_pattern(gray, points, radius, method="uniform") <= points
+
+
+    def _refine_with_lbp(self, gray: np.ndarray, mask: np.ndarray, params: DetectParams, uniform=None):
         if not _HAS_SKIMG: return mask
-        
-        lbp = local_binary_pattern(gray, params.lbp_points, params.lbp_rad, method="uniform")
 
         num, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
-        out = np.zeros_like(mask)
+        if num <= 1: return np.zeros_like(mask)
 
-        for i in range(1, num):
-            comp = (labels == i)
-            region = lbp[comp]
-            if region.size == 0:
-                continue
+        region = labels
+        if uniform is None:
+            # LBP only over the candidates' bbox, padded by the sampling radius
+            x, y, w, h = cv2.boundingRect(mask)
+            pad = int(np.ceil(params.lbp_rad)) + 1
+            y0, y1 = max(0, y - pad), min(gray.shape[0], y + h + pad)
+            x0, x1 = max(0, x - pad), min(gray.shape[1], x + w + pad)
 
-            # In 'uniform' LBP, uniform patterns are <= p, non-uniform are > p
-            uniform_ratio = float(np.sum(region <= params.lbp_points)) / float(region.size)
+            uniform = self._lbp_uniform(gray[y0:y1, x0:x1], params.lbp_points, params.lbp_rad)
+            region = labels[y0:y1, x0:x1]
 
-            # too uniform -> likely wall texture/paint, not mold
-            if uniform_ratio > params.lbp_uniform_th:
-                continue
+        # count uniform pixels for all components at once
+        uniform_counts = np.bincount(region[uniform], minlength=num)
+        uniform_ratio = uniform_counts / stats[:, cv2.CC_STAT_AREA].astype(np.float64)
 
-            out[comp] = 255
+        # too uniform -> likely wall texture/paint, not mold
+        keep = uniform_ratio <= params.lbp_uniform_th
+        keep[0] = False # background
 
-        return out
+        lut = np.where(keep, 255, 0).astype(mask.dtype)
+        return lut[labels]
     
 
     def _morph_refine(self, mask: np.ndarray, elemsize=7, open_iter=1, close_iter=1):
@@ -336,8 +762,8 @@ class Processor:
         return mask
 
 
-    def _estimate_texture_level(self, gray: np.ndarray):
-        var = self._variance_multiscale(gray, scales=[9], normalize=True)
+    def _estimate_texture_level(self, gray: np.ndarray, pre: PreprocessedImage | None = None):
+        var = self._variance_multiscale(gray, scales=[9], normalize=True, pre=pre)
         tail = float(np.mean(var > 60))
 
         if tail < 0.01:
@@ -356,37 +782,4 @@ class Processor:
 
     
     def _apply_mask(self, img:np.ndarray, mask=None):
-        if img is None: return None
-
-        # resize and overlay
-        oh, ow = img.shape[:2]
-
-        if mask is not None:
-            mask = cv2.resize(mask, (ow, oh), interpolation=cv2.INTER_NEAREST)
-
-        if img.ndim == 2:
-            base_bgr = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-        else:
-            base_bgr = img.copy()
-
-        display = base_bgr.copy()
-
-        if mask is not None:
-            _red = np.zeros_like(display)
-            _red[:, :, 2] = 255
-            display = cv2.addWeighted(display, 0.7, _red, 0.3, 0)
-            display[mask==0] = base_bgr[mask==0]
-
-        return display
-    
-
-    def _plot_histogram(self, var_map, curr_th):
-        plt.figure(figsize=(6, 4))
-        plt.hist(var_map.ravel(), bins=256, range=(0, 256), color='gray', alpha=0.7)
-        plt.axvline(curr_th, color='r', linestyle='--', label=f"th={curr_th:.2f}")
-        plt.legend()
-        plt.title("Variance Histogram + Threshold")
-        plt.xlabel("Variance Value")
-        plt.ylabel("Frequency")
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
+        return overlay(img, mask)
\ No newline at end of file
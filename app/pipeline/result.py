@@ -0,0 +1,47 @@
+from .mask import PackedMask
+
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+
+
+@dataclass
+class DetectionResult:
+    # everything measured at working resolution, the mask shape
+    mask: PackedMask
+    threshold: float | None = None
+    components: int = 0
+    # per component, background excluded: pixels, (x, y, w, h), (x, y)
+    areas: np.ndarray = field(default_factory=lambda: np.zeros(0, np.int32))
+    bboxes: np.ndarray = field(default_factory=lambda: np.zeros((0, 4), np.int32))
+    centroids: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), np.float64))
+    affected_ratio: float = 0.0
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+
+    @property
+    def nbytes(self):
+        # what the store charges for a memoized result
+        return self.mask.nbytes + self.areas.nbytes + self.bboxes.nbytes + self.centroids.nbytes
+
+
+def measure(mask: np.ndarray, threshold=None):
+    # one labelling pass gives areas, boxes and centroids, the affected
+    # ratio is the summed areas so the mask is not counted again
+    num, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    areas = stats[1:, cv2.CC_STAT_AREA].copy()
+    h, w = mask.shape[:2]
+
+    return DetectionResult(
+        mask=PackedMask(mask),
+        threshold=None if threshold is None else float(threshold),
+        components=num - 1,
+        areas=areas,
+        bboxes=stats[1:, :cv2.CC_STAT_AREA].copy(),
+        centroids=centroids[1:].copy(),
+        affected_ratio=float(areas.sum()) / float(h * w),
+    )
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+
+
+# local variance of uint8 data never exceeds 127.5^2, so float variance maps
+# can be binned over a fixed range without a min/max pass first
+VAR_RANGE = (-1.0, 128.0 * 128.0)
+VAR_BINS = 65536
+
+
+def histogram_u8(img: np.ndarray):
+    return np.bincount(img.ravel(), minlength=256)
+
+
+def quantile_from_hist(counts: np.ndarray, q: float, values=None):
+    # same result as np.percentile(data, 100 * q) with the default 'linear'
+    # method, using the sorted order implied by the counts
+    if values is None:
+        values = np.arange(len(counts), dtype=np.float64)
+
+    cum = np.cumsum(counts)
+    n = int(cum[-1])
+    if n == 0: return 0.0
+
+    pos = float(q) * (n - 1)
+    lo = int(np.floor(pos))
+    frac = pos - lo
+
+    v_lo = float(values[np.searchsorted(cum, lo, side="right")])
+    if frac == 0.0: return v_lo
+
+    v_hi = float(values[np.searchsorted(cum, lo + 1, side="right")])
+    return v_lo + frac * (v_hi - v_lo)
+
+
+def percentile_u8(img: np.ndarray, p: float, hist=None):
+    if hist is None:
+        hist = histogram_u8(img)
+    return quantile_from_hist(hist, p / 100.0)
+
+
+def median_mad_u8(img: np.ndarray, hist=None):
+    if hist is None:
+        hist = histogram_u8(img)
+
+    med = quantile_from_hist(hist, 0.5)
+
+    # |v - med| over the 256 levels, ordered, weighted by the same counts
+    dev = np.abs(np.arange(256, dtype=np.float64) - med)
+    order = np.argsort(dev, kind="stable")
+    mad = quantile_from_hist(hist[order], 0.5, values=dev[order])
+
+    return med, mad
+
+
+def compute_threshold(var_map_u8: np.ndarray, params, hist=None):
+    if params.th_mode == "fixed":
+        return params.fixed_th
+
+    if hist is None:
+        hist = histogram_u8(var_map_u8)
+
+    if params.th_mode == "zscore":
+        med, mad = median_mad_u8(var_map_u8, hist)
+        # 1.4826 * MAD approximates std for normal distribution
+        robust_std = 1.4826 * (mad + 1e-6)
+        return float(med + params.z_k * robust_std)
+
+    p = max(50.0, min(99.5, params.percentile))
+
+    return percentile_u8(var_map_u8, p, hist)
+
+
+def float_histogram(arr: np.ndarray, value_range=VAR_RANGE, bins=VAR_BINS):
+    lo, hi = value_range
+    return cv2.calcHist([arr.astype(np.float32, copy=False)], [0], None, [bins], [lo, hi]).ravel()
+
+
+def float_percentiles(arr: np.ndarray, ps, value_range=VAR_RANGE, bins=VAR_BINS):
+    return percentiles_from_float_hist(float_histogram(arr, value_range, bins), ps, value_range, bins)
+
+
+def percentiles_from_float_hist(hist: np.ndarray, ps, value_range=VAR_RANGE, bins=VAR_BINS):
+    # fixed-bin histogram, linear inside the bin; resolution is
+    # (range / bins), a quarter variance unit for the default range.
+    # Histograms of tiles can be summed first.
+    lo, hi = value_range
+
+    cum = np.cumsum(hist, dtype=np.float64)
+    n = cum[-1]
+    if n == 0: return [0.0 for _ in ps]
+
+    width = (hi - lo) / bins
+    out = []
+    for p in ps:
+        rank = p / 100.0 * (n - 1) + 0.5
+        b = min(int(np.searchsorted(cum, rank, side="left")), bins - 1)
+        before = cum[b - 1] if b > 0 else 0.0
+        inside = (rank - before) / hist[b] if hist[b] > 0 else 0.0
+        out.append(lo + (b + inside) * width)
+
+    return out
+
+
+def normalize_clipped_u8(arr: np.ndarray, lo: float, hi: float):
+    # clip to [lo, hi] and stretch to 0..255 (truncating, like
+    # cv2.normalize(NORM_MINMAX) + astype) working in place on arr
+    if hi <= lo:
+        return np.zeros(arr.shape, np.uint8)
+
+    arr -= lo
+    arr *= 255.0 / (hi - lo)
+    np.clip(arr, 0, 255, out=arr)
+    return arr.astype(np.uint8)
@@ -0,0 +1,210 @@
+import cv2
+import numpy as np
+
+
+class TileGrid:
+    # Row-major tiles covering an image. Tile edges fall on multiples of 8
+    # columns, so tile masks can be written straight into a PackedMask.
+
+    def __init__(self, shape, tile=2048):
+        self.shape = tuple(shape[:2])
+        self.tile = max(8, int(tile) // 8 * 8)
+
+        h, w = self.shape
+        self.rows = (h + self.tile - 1) // self.tile
+        self.cols = (w + self.tile - 1) // self.tile
+
+
+    def __len__(self):
+        return self.rows * self.cols
+
+
+    def __iter__(self):
+        # (index, (y0, y1, x0, x1)) of every tile core
+        h, w = self.shape
+        t = self.tile
+        for r in range(self.rows):
+            for c in range(self.cols):
+                yield r * self.cols + c, (r * t, min(r * t + t, h), c * t, min(c * t + t, w))
+
+
+    def window(self, core, halo):
+        # core grown by halo and clipped to the image, with the slices that
+        # cut the core back out of an array covering the window
+        y0, y1, x0, x1 = core
+        h, w = self.shape
+
+        wy0, wy1 = max(0, y0 - halo), min(h, y1 + halo)
+        wx0, wx1 = max(0, x0 - halo), min(w, x1 + halo)
+
+        return (wy0, wy1, wx0, wx1), (slice(y0 - wy0, y1 - wy0), slice(x0 - wx0, x1 - wx0))
+
+
+    def around(self, indices):
+        # the given tiles plus their 8 neighbours, index -> core
+        cores = dict(self)
+        out = {}
+        for index in indices:
+            r, c = divmod(index, self.cols)
+            for rr in range(max(0, r - 1), min(self.rows, r + 2)):
+                for cc in range(max(0, c - 1), min(self.cols, c + 2)):
+                    out[rr * self.cols + cc] = cores[rr * self.cols + cc]
+        return dict(sorted(out.items()))
+
+
+class TiledComponents:
+    # 8-connected components of a mask that is only ever seen one tile at a
+    # time. Tiles are labelled on their own, labels touching across a seam
+    # are merged by union-find over the tile borders in resolve(). Tiles
+    # never added count as empty.
+
+    def __init__(self, grid: TileGrid):
+        self.grid = grid
+        self.count = 0
+        self.num = 0
+
+        self._offsets = {}
+        self._borders = {}
+        # per local label: x0, y0, x1, y1, area, sum x, sum y, weight sum
+        self._stats = []
+        self._ids = None
+
+
+    def add(self, index, core, mask: np.ndarray, weights: np.ndarray | None = None):
+        # mask covers the tile core; returns its labels, which are the same
+        # every time the same mask is labelled again
+        num, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        offset = self.count
+        self._offsets[index] = (offset, num - 1)
+        self.count += num - 1
+
+        def glob(v):
+            return np.where(v > 0, v.astype(np.int64) + offset, 0)
+        self._borders[index] = (glob(labels[0]), glob(labels[-1]), glob(labels[:, 0]), glob(labels[:, -1]))
+
+        y0, _, x0, _ = core
+        s = stats[1:].astype(np.float64)
+        area = s[:, cv2.CC_STAT_AREA]
+
+        if weights is None:
+            weighted = np.zeros(num - 1)
+        else:
+            weighted = np.bincount(labels.ravel(), weights=weights.ravel().astype(np.float64), minlength=num)[1:]
+
+        self._stats.append(np.column_stack([
+            s[:, 0] + x0,
+            s[:, 1] + y0,
+            s[:, 0] + s[:, 2] + x0,
+            s[:, 1] + s[:, 3] + y0,
+            area,
+            (centroids[1:, 0] + x0) * area,
+            (centroids[1:, 1] + y0) * area,
+            weighted,
+        ]))
+        return labels
+
+
+    def resolve(self):
+        parent = np.arange(self.count + 1)
+        a, b = self._seam_pairs()
+
+        while len(a):
+            ra, rb = parent[a], parent[b]
+            if np.array_equal(ra, rb): break
+
+            low = np.minimum(ra, rb)
+            np.minimum.at(parent, ra, low)
+            np.minimum.at(parent, rb, low)
+
+            # pointer jumping until every label points at its root
+            while True:
+                up = parent[parent]
+                if np.array_equal(up, parent): break
+                parent = up
+
+        roots, ids = np.unique(parent[1:], return_inverse=True)
+        self.num = len(roots)
+        # global label -> component id, 0 stays background
+        self._ids = np.concatenate([[0], ids + 1])
+
+
+    def lut(self, index, values: np.ndarray):
+        # per local label of one tile -> values[component - 1], 0 for background
+        offset, n = self._offsets[index]
+        out = np.zeros(n + 1, values.dtype)
+        out[1:] = values[self._ids[offset + 1:offset + n + 1] - 1]
+        return out
+
+
+    def components(self):
+        # areas, (x, y, w, h) boxes, centroids and weight sums per component
+        n = self.num
+        s = np.concatenate(self._stats) if self._stats else np.zeros((0, 8))
+        ids = self._ids[1:] - 1
+
+        areas = np.bincount(ids, weights=s[:, 4], minlength=n)
+
+        x0 = np.full(n, np.inf)
+        y0 = np.full(n, np.inf)
+        x1 = np.zeros(n)
+        y1 = np.zeros(n)
+        np.minimum.at(x0, ids, s[:, 0])
+        np.minimum.at(y0, ids, s[:, 1])
+        np.maximum.at(x1, ids, s[:, 2])
+        np.maximum.at(y1, ids, s[:, 3])
+
+        safe = np.maximum(areas, 1)
+        centroids = np.column_stack([
+            np.bincount(ids, weights=s[:, 5], minlength=n) / safe,
+            np.bincount(ids, weights=s[:, 6], minlength=n) / safe,
+        ])
+
+        bboxes = np.column_stack([x0, y0, x1 - x0, y1 - y0]).astype(np.int64) if n else np.zeros((0, 4), np.int64)
+        weights = np.bincount(ids, weights=s[:, 7], minlength=n)
+
+        return areas.astype(np.int64), bboxes, centroids, weights
+
+
+    def _seam_pairs(self):
+        # label pairs that touch (8-connected) across a tile seam
+        g = self.grid
+        pairs = []
+
+        def link(u, v):
+            m = (u > 0) & (v > 0)
+            if m.any(): pairs.append(np.stack([u[m], v[m]]))
+
+        def border(r, c, side):
+            b = self._borders.get(r * g.cols + c)
+            return None if b is None else b[side]
+
+        for r in range(g.rows):
+            for c in range(g.cols):
+                if r * g.cols + c not in self._borders: continue
+                _, bottom, _, right = self._borders[r * g.cols + c]
+
+                left = border(r, c + 1, 2) if c + 1 < g.cols else None
+                if left is not None:
+                    link(right, left)
+                    link(right[1:], left[:-1])
+                    link(right[:-1], left[1:])
+
+                top = border(r + 1, c, 0) if r + 1 < g.rows else None
+                if top is not None:
+                    link(bottom, top)
+                    link(bottom[1:], top[:-1])
+                    link(bottom[:-1], top[1:])
+
+                # corners to the diagonal neighbours
+                if r + 1 < g.rows:
+                    corner = border(r + 1, c + 1, 0) if c + 1 < g.cols else None
+                    if corner is not None: link(bottom[-1:], corner[:1])
+                    corner = border(r + 1, c - 1, 0) if c > 0 else None
+                    if corner is not None: link(bottom[:1], corner[-1:])
+
+        if not pairs:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+        p = np.unique(np.concatenate(pairs, axis=1), axis=1)
+        return p[0], p[1]
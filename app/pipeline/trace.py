@@ -0,0 +1,173 @@
+from .cache import nbytes_of
+
+from collections import deque
+import functools
+import json
+import os
+import threading
+import time
+
+
+# oldest events are dropped past this, a long GUI session stays bounded
+MAX_EVENTS = 200_000
+
+
+class Tracer:
+    # Opt-in wall time per stage and image. Off, a traced call costs one
+    # attribute check. Calls nest per thread; the outermost ones (preprocess,
+    # detect, ...) are kept per image as its latest run for summary().
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # image -> {outermost call name: (event, [events directly inside])}
+        self._runs = {}
+
+
+    def enable(self, on=True):
+        self.enabled = bool(on)
+
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self._runs.clear()
+
+
+    def call(self, name, st, fn, *args, source=None, **kwargs):
+        # source() gives what the call ran on (an array or a shape); it is
+        # asked once the call is done, so it never triggers work of its
+        # own. Without one the first array argument is taken
+        if not self.enabled: return fn(*args, **kwargs)
+        if source is None: source = lambda: next((a for a in args if a is not st and hasattr(a, "shape")), None)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        nested = []
+        stack.append(nested)
+        start = time.perf_counter_ns()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            end = time.perf_counter_ns()
+            stack.pop()
+
+        event = {
+            "name": name,
+            "image": getattr(st, "path", None),
+            "ts": start // 1000,
+            "dur": (end - start) // 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "shape": _shape_of(source()),
+            "out_shape": _shape_of(result),
+            # bytes of what the stage returned, scratch memory is not seen
+            "bytes": nbytes_of(result),
+        }
+
+        with self._lock:
+            self.events.append(event)
+            if stack:
+                stack[-1].append(event)
+            elif event["image"] is not None:
+                self._runs.setdefault(event["image"], {})[name] = (event, nested)
+
+        return result
+
+
+    def wrap(self, name, st, fn, source=None):
+        return lambda: self.call(name, st, fn, source=source)
+
+
+    def drain(self):
+        # hand the events over (e.g. from a batch worker) and forget them
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+            self._runs.clear()
+        return events
+
+
+    def summary(self, st, top=3):
+        # "preprocess 85 ms | detect 310 ms (var 180, lbp 90, morph 25)"
+        with self._lock:
+            runs = dict(self._runs.get(getattr(st, "path", None), {}))
+        if not runs: return ""
+
+        parts = []
+        for name in sorted(runs, key=lambda n: runs[n][0]["ts"]):
+            event, nested = runs[name]
+            text = f"{name} {event['dur'] / 1000:.0f} ms"
+
+            slow = {}
+            for e in nested:
+                slow[e["name"]] = slow.get(e["name"], 0) + e["dur"]
+            slow = sorted(slow.items(), key=lambda kv: -kv[1])[:top]
+            if slow:
+                text += " (" + ", ".join(f"{n} {d / 1000:.0f}" for n, d in slow) + ")"
+            parts.append(text)
+
+        return " | ".join(parts)
+
+
+def traced(name, source=None):
+    # method decorator, the first argument after self is the ImageState;
+    # source(self, st) gives what the method ran on
+    def wrap(method):
+        @functools.wraps(method)
+        def inner(self, st, *args, **kwargs):
+            if not TRACE.enabled: return method(self, st, *args, **kwargs)
+            return TRACE.call(
+                name, st, method, self, st, *args,
+                source=(lambda: source(self, st)) if source else None, **kwargs
+            )
+        return inner
+    return wrap
+
+
+def _shape_of(value):
+    # first array of a tuple result, or a bare shape
+    for v in (value if isinstance(value, tuple) and not _is_shape(value) else (value,)):
+        if hasattr(v, "shape"): return list(v.shape)
+        if _is_shape(v): return list(v)
+    return None
+
+
+def _is_shape(value):
+    return isinstance(value, tuple) and all(isinstance(n, int) for n in value)
+
+
+def chrome_trace(events):
+    # trace-event format, loads in chrome://tracing, Perfetto or speedscope
+    out = []
+    for pid in sorted({e["pid"] for e in events}):
+        name = "MoldVision" if pid == os.getpid() else f"MoldVision worker {pid}"
+        out.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+
+    for e in events:
+        out.append({
+            "name": e["name"],
+            "cat": "stage",
+            "ph": "X",
+            "ts": e["ts"],
+            "dur": e["dur"],
+            "pid": e["pid"],
+            "tid": e["tid"],
+            "args": {"image": e["image"], "shape": e["shape"], "out_shape": e["out_shape"], "bytes": e["bytes"]},
+        })
+
+    return {"traceEvents": out, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(path, events):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(events), f)
+
+
+# one tracer per process, switched on from the GUI or batch --trace
+TRACE = Tracer()
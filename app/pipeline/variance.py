@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import threading
+
+
+class VarianceEngine:
+    # Local variance of one grayscale image for any odd window size.
+    # Sum and squared-sum integral images are built once over a reflect-101
+    # padded copy (same border as cv2.boxFilter), after that every scale is
+    # four lookups per pixel regardless of the window size.
+
+    def __init__(self, gray: np.ndarray, max_scale=21):
+        self.gray = gray
+        self.shape = gray.shape[:2]
+        self._maps = {}
+        self._lock = threading.Lock()
+        # integrals are built on the first scale that is not seeded
+        self._max_scale = max_scale
+        self._sum = self._sqsum = None
+        self._pad = 0
+
+
+    def seed(self, k: int, var: np.ndarray):
+        # a map computed earlier for the same image, never written to
+        with self._lock:
+            self._maps.setdefault(int(k), var)
+
+
+    def variance(self, k: int):
+        k = int(k)
+        if k < 1 or k % 2 == 0:
+            raise ValueError(f"Window size must be odd and positive: {k}")
+
+        with self._lock:
+            var = self._maps.get(k)
+            if var is not None: return var
+
+            if self._sum is None or k // 2 > self._pad:
+                self._build(max(k, self._max_scale))
+
+            var = self._box_variance(k)
+            self._maps[k] = var
+            return var
+
+
+    def max_variance(self, scales):
+        # per pixel max over scales, cached maps are never written to
+        combined = None
+        for k in scales:
+            var = self.variance(k)
+            if combined is None:
+                combined = var.copy()
+            else:
+                np.maximum(combined, var, out=combined)
+        return combined
+
+
+    def _build(self, max_scale):
+        pad = max(1, int(max_scale) // 2)
+        padded = cv2.copyMakeBorder(self.gray, pad, pad, pad, pad, cv2.BORDER_REFLECT_101)
+
+        # float64 keeps the sums exact for uint8 input
+        self._sum, self._sqsum = cv2.integral2(padded, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        self._pad = pad
+
+
+    def _box_sum(self, integral, k):
+        h, w = self.shape
+        o = self._pad - k // 2
+
+        # views into the integral, cv2 handles the row stride without copies
+        s = cv2.subtract(integral[o + k:o + k + h, o + k:o + k + w], integral[o:o + h, o + k:o + k + w])
+        cv2.subtract(s, integral[o + k:o + k + h, o:o + w], dst=s)
+        cv2.add(s, integral[o:o + h, o:o + w], dst=s)
+        return s
+
+
+    def _box_variance(self, k):
+        n = float(k * k)
+
+        s = self._box_sum(self._sum, k)
+        sq = self._box_sum(self._sqsum, k)
+
+        # var = (sum(x^2) - sum(x)^2 / n) / n
+        cv2.subtract(sq, cv2.multiply(s, s, scale=1.0 / n), dst=sq)
+        sq *= 1.0 / n
+        return sq.astype(np.float32)
@@ -0,0 +1,438 @@
+from .defs import PreprocessParams, DetectParams, ExportParams
+from .state import ImageState, PreprocessedImage
+from .export import encode_flags, write_mask
+from .pipeline.imageio import read_shape
+from .pipeline.mask import PackedMask
+from .pipeline.result import DetectionResult
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, fields
+import hashlib
+import io
+import json
+import os
+import threading
+import weakref
+import zipfile
+
+from PIL import Image
+import cv2
+import numpy as np
+
+
+PROJECT_EXT = ".mvproj"
+PROJECT_VERSION = 1
+
+THUMB_SIZE = 32
+THUMB_STAGES = ("original", "preprocessed", "detected")
+
+# grayscale members: fast deflate, these are written on every save
+_GRAY_PARAMS = ExportParams(fmt="png", png_compression=1)
+
+# (path, size, mtime_ns) -> content hash, so a file is hashed once per session
+_HASHES = {}
+_HASHES_LOCK = threading.Lock()
+
+# open readers by project path, closed before that file is replaced
+_READERS = weakref.WeakValueDictionary()
+
+
+# ====================== FILES ======================
+
+def file_hash(path, stat=None):
+    stat = stat or os.stat(path)
+    ident = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _HASHES_LOCK:
+        cached = _HASHES.get(ident)
+    if cached: return cached
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    digest = "blake2b:" + h.hexdigest()
+    with _HASHES_LOCK:
+        _HASHES[ident] = digest
+    return digest
+
+
+def _remember_hash(path, stat, digest):
+    with _HASHES_LOCK:
+        _HASHES[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def _relpath(path, start):
+    # None across drives, where no relative path exists
+    try:
+        return os.path.relpath(os.path.abspath(path), start)
+    except ValueError:
+        return None
+
+
+def _member_name(kind, data, ext):
+    # content addressed: an unchanged array keeps its name across saves,
+    # so lazy readers of the previous file stay valid after a re-save
+    return f"{kind}/{hashlib.blake2b(data, digest_size=16).hexdigest()}.{ext}"
+
+
+def _as_tuple(value):
+    # stage keys come back from JSON as nested lists
+    if isinstance(value, list):
+        return tuple(_as_tuple(v) for v in value)
+    return value
+
+
+def _params_from_dict(cls, values):
+    # keys a newer version wrote are ignored, missing ones keep defaults
+    known = {f.name for f in fields(cls)}
+    return cls(**{k: v for k, v in values.items() if k in known})
+
+
+# ====================== SAVED COPY ======================
+
+class SavedCopy:
+    # What an image looked like in the project it was opened from. Each
+    # entry is tied to the slot (or mask) it was saved from and only holds
+    # while that is still the live one, so edits fall back to the pipeline.
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.thumbs = {}    # stage -> (slot, BGR thumbnail)
+        self.members = {}   # "gray" / "mask" / "stats" -> (slot, member name)
+
+
+    def thumb(self, stage, slot):
+        entry = self.thumbs.get(stage)
+        return entry[1] if entry is not None and entry[0] is slot else None
+
+
+    def member(self, kind, slot):
+        entry = self.members.get(kind)
+        return entry[1] if entry is not None and entry[0] is slot else None
+
+
+class ProjectReader:
+    # Reads members of one project file on demand, from any thread.
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._zip = None
+        self._lock = threading.Lock()
+        _READERS[self.path] = self
+
+
+    def read(self, name):
+        with self._lock:
+            # reopened after close(), e.g. once the file has been re-saved
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.path, "r")
+            return self._zip.read(name)
+
+
+    def read_gray(self, name):
+        buf = np.frombuffer(self.read(name), np.uint8)
+        return cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+
+
+    def read_mask_bits(self, name):
+        # 1-bit PNG rows are the PackedMask rows, no unpacking
+        img = Image.open(io.BytesIO(self.read(name)))
+        w, h = img.size
+        return np.frombuffer(img.tobytes(), np.uint8).reshape(h, (w + 7) // 8).copy()
+
+
+    def read_stats(self, name):
+        with np.load(io.BytesIO(self.read(name))) as z:
+            return {k: z[k] for k in z.files}
+
+
+    def close(self):
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+
+
+# ====================== SAVE ======================
+
+def encode_entry(st: ImageState, project_dir):
+    # (manifest entry, {member name: bytes}); worker thread, members still
+    # unchanged since they were opened are copied over, not re-encoded
+    saved = st.saved
+    members = {}
+
+    stat = os.stat(st.path)
+    entry = {
+        "path": os.path.abspath(st.path),
+        "rel": _relpath(st.path, project_dir),
+        "filename": st.filename,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": file_hash(st.path, stat),
+        "shape": list(st.shape) if st.shape is not None else None,
+        "custom": st.custom,
+        "info": st.info,
+        "preprocess": asdict(st.preprocess_params),
+        "detect": asdict(st.detect_params),
+        "preprocessed": None,
+        "detection": None,
+        "thumbs": None,
+    }
+
+    def add(kind, slot, ext, encode):
+        name = saved.member(kind, slot) if saved is not None else None
+        data = saved.reader.read(name) if name is not None else encode()
+        name = name or _member_name(kind, data, ext)
+        members[name] = data
+        return name
+
+    pre = st.preprocessed
+    # keyless images (built outside preprocess()) cannot be rebuilt, skip them
+    if pre is not None and pre.ready and pre.key:
+        def encode_gray():
+            ok, buf = cv2.imencode(".png", pre.img, encode_flags(_GRAY_PARAMS))
+            if not ok: raise ValueError("Failed to encode the preprocessed image")
+            return buf.tobytes()
+
+        entry["preprocessed"] = {
+            "key": pre.key,
+            "texture": pre.texture,
+            "shape": list(pre.slot.shape),
+            "gray": add("gray", pre.slot, "png", encode_gray),
+        }
+
+    det = st.detection
+    if det is not None:
+        def encode_mask():
+            buf = io.BytesIO()
+            write_mask(buf, det.mask, _GRAY_PARAMS)
+            return buf.getvalue()
+
+        def encode_stats():
+            buf = io.BytesIO()
+            np.savez(buf, areas=det.areas, bboxes=det.bboxes, centroids=det.centroids)
+            return buf.getvalue()
+
+        entry["detection"] = {
+            "threshold": det.threshold,
+            "components": det.components,
+            "affected_ratio": det.affected_ratio,
+            "shape": list(det.mask.shape),
+            "mask": add("mask", det.mask, "png", encode_mask),
+            "stats": add("stats", det.mask, "npz", encode_stats),
+        }
+
+    entry["thumbs"], sprite = _thumb_sprite(st)
+    if sprite is not None:
+        ok, buf = cv2.imencode(".png", sprite)
+        if ok:
+            data = buf.tobytes()
+            entry["thumb_sprite"] = _member_name("thumbs", data, "png")
+            members[entry["thumb_sprite"]] = data
+
+    return entry, members
+
+
+def _thumb_sprite(st: ImageState):
+    # the sidebar icons side by side, so an opened project lists without
+    # decoding a single image
+    slots = {
+        "original": st.scaled_slot,
+        "preprocessed": st.preprocessed.slot if st.preprocessed is not None and st.preprocessed.ready else None,
+        "detected": st.detection.mask if st.detection is not None else None,
+    }
+
+    stages, thumbs = [], []
+    for stage in THUMB_STAGES:
+        slot = slots[stage]
+        if slot is None: continue
+        thumb = st.saved.thumb(stage, slot) if st.saved is not None else None
+        if thumb is None:
+            try:
+                thumb = st.thumbnail(stage, THUMB_SIZE)
+            except Exception:
+                continue
+        stages.append(stage)
+        thumbs.append(thumb)
+
+    if not thumbs: return [], None
+    return stages, np.hstack(thumbs)
+
+
+class ProjectWriter:
+    # Writes into a temporary file next to `path`; close() adds the manifest
+    # and replaces `path`, abort() leaves an existing project untouched.
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.tmp = self.path + ".tmp"
+        self.entries = []   # (order, entry)
+        self._zip = zipfile.ZipFile(self.tmp, "w", zipfile.ZIP_STORED)
+        self._names = set()
+
+
+    def add(self, entry, members, order=None):
+        # PNG members are already deflated, stored as is; the same content
+        # is written once. Entries are listed by `order`, so they may be
+        # added as they finish
+        for name, data in members.items():
+            if name in self._names: continue
+            method = zipfile.ZIP_DEFLATED if name.endswith(".npz") else zipfile.ZIP_STORED
+            self._zip.writestr(name, data, compress_type=method)
+            self._names.add(name)
+        self.entries.append((len(self.entries) if order is None else order, entry))
+
+
+    def close(self):
+        entries = [entry for _, entry in sorted(self.entries, key=lambda e: e[0])]
+        manifest = {"version": PROJECT_VERSION, "images": entries}
+        self._zip.writestr("project.json", json.dumps(manifest, indent=1), compress_type=zipfile.ZIP_DEFLATED)
+        self._zip.close()
+
+        reader = _READERS.get(self.path)
+        if reader is not None: reader.close()
+        os.replace(self.tmp, self.path)
+
+
+    def abort(self):
+        self._zip.close()
+        try: os.remove(self.tmp)
+        except OSError: pass
+
+
+def save_project(path, images, workers=None, progress=None):
+    # returns [(image, error)]; images that fail are left out of the file
+    project_dir = os.path.dirname(os.path.abspath(path))
+    writer = ProjectWriter(path)
+    errors = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(encode_entry, st, project_dir) for st in images]
+            for done, (st, fut) in enumerate(zip(images, futures), 1):
+                try:
+                    writer.add(*fut.result())
+                except Exception as e:
+                    errors.append((st, e))
+                if progress:
+                    progress(done, len(images))
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close()
+    return errors
+
+
+# ====================== OPEN ======================
+
+def read_manifest(path):
+    # (reader, manifest entries)
+    reader = ProjectReader(path)
+    manifest = json.loads(reader.read("project.json"))
+    if manifest.get("version", 0) > PROJECT_VERSION:
+        raise ValueError(f"Project version {manifest['version']} is newer than this MoldVision")
+    return reader, manifest.get("images", [])
+
+
+def open_project(path):
+    # (images, problems): only the manifest, thumbnails and component stats
+    # are read here; grayscale and masks are read when an image needs them
+    reader, entries = read_manifest(path)
+    project_dir = os.path.dirname(reader.path)
+    images, problems = [], []
+    for entry in entries:
+        try:
+            st, problem = load_entry(reader, entry, project_dir)
+        except Exception as e:
+            st, problem = None, f"{entry.get('filename', '?')}: {e}"
+        if st is not None: images.append(st)
+        if problem: problems.append(problem)
+
+    return images, problems
+
+
+def _locate(entry, project_dir):
+    # the stored absolute path, else where the relative path points now
+    # (project and images moved together)
+    if os.path.isfile(entry["path"]): return entry["path"]
+    if entry.get("rel"):
+        moved = os.path.normpath(os.path.join(project_dir, entry["rel"]))
+        if os.path.isfile(moved): return moved
+    return None
+
+
+def load_entry(reader: ProjectReader, entry, project_dir):
+    # (ImageState or None, problem or None)
+    name = entry["filename"]
+    path = _locate(entry, project_dir)
+    if path is None:
+        return None, f"{name}: file not found"
+
+    stat = os.stat(path)
+    same = stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+    # only a changed size or time costs a re-hash
+    if same or file_hash(path, stat) == entry["hash"]:
+        _remember_hash(path, stat, entry["hash"])
+        fresh = True
+    else:
+        fresh = False
+
+    st = ImageState(
+        path=path, filename=name,
+        preprocess_params=_params_from_dict(PreprocessParams, entry.get("preprocess", {})),
+        detect_params=_params_from_dict(DetectParams, entry.get("detect", {})),
+        shape=tuple(entry["shape"]) if fresh and entry.get("shape") else read_shape(path),
+    )
+    st.custom = bool(entry.get("custom", False))
+    if not fresh:
+        # params still apply, the arrays were made from other pixels
+        return st, f"{name}: file changed since the project was saved, results dropped"
+
+    st.info = entry.get("info", "")
+    saved = st.saved = SavedCopy(reader)
+
+    pre = entry.get("preprocessed")
+    if pre:
+        key = _as_tuple(pre["key"])
+        gray = pre["gray"]
+        st.preprocessed = PreprocessedImage(
+            texture=pre["texture"], key=key, cache=st.cache,
+            loader=lambda: reader.read_gray(gray)
+        )
+        saved.members["gray"] = (st.preprocessed.slot, gray)
+        # auto mode picks the method from the scaled image, known already
+        if not st.custom:
+            st.cache.put(("auto_gray",), key[1] if key[0] == "gray" else key[1][1])
+
+    det = entry.get("detection")
+    if det:
+        mask_name = det["mask"]
+        mask = PackedMask(shape=det["shape"], loader=lambda: reader.read_mask_bits(mask_name))
+        stats = reader.read_stats(det["stats"])
+        st.detection = DetectionResult(
+            mask=mask,
+            threshold=det["threshold"],
+            components=det["components"],
+            areas=stats["areas"],
+            bboxes=stats["bboxes"],
+            centroids=stats["centroids"],
+            affected_ratio=det["affected_ratio"],
+        )
+        saved.members["mask"] = (mask, mask_name)
+        saved.members["stats"] = (mask, det["stats"])
+
+    sprite_name = entry.get("thumb_sprite")
+    if sprite_name:
+        sprite = cv2.imdecode(np.frombuffer(reader.read(sprite_name), np.uint8), cv2.IMREAD_COLOR)
+        slots = {
+            "original": st.scaled_slot,
+            "preprocessed": st.preprocessed.slot,
+            "detected": st.detection.mask if st.detection is not None else None,
+        }
+        for i, stage in enumerate(entry.get("thumbs", [])):
+            if slots.get(stage) is None: continue
+            saved.thumbs[stage] = (slots[stage], sprite[:, i * THUMB_SIZE:(i + 1) * THUMB_SIZE].copy())
+
+    return st, None
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import traceback
+
+
+class TaskRunner:
+    # Runs a job over items on a thread pool (OpenCV releases the GIL) and
+    # hands results back to the Tk thread via root.after. Only a few items
+    # are in flight at once, so cancel stops scheduling immediately and the
+    # results of items still running are dropped.
+
+    def __init__(self, root, workers=None, poll_ms=50):
+        self.root = root
+        self.workers = workers or os.cpu_count() or 2
+        self.max_in_flight = self.workers * 2
+        self.poll_ms = poll_ms
+
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="moldvision")
+        self._generation = 0
+        self._reset()
+
+
+    @property
+    def busy(self):
+        return self._items is not None
+
+
+    def start(self, items, job, on_result, on_progress=None, on_done=None):
+        # job(item) runs on a worker thread and must not touch Tk,
+        # the callbacks all run on the Tk thread
+        self.cancel()
+
+        self._generation += 1
+        self._items = iter(list(items))
+        self._total = len(items)
+        self._job = job
+        self._on_result = on_result
+        self._on_progress = on_progress
+        self._on_done = on_done
+
+        self._schedule()
+        if self._on_progress: self._on_progress(0, self._total)
+        self._poll_id = self.root.after(self.poll_ms, self._poll, self._generation)
+
+
+    def cancel(self):
+        if not self.busy: return
+
+        for _, fut in self._in_flight:
+            fut.cancel()
+
+        on_done = self._on_done
+        self._generation += 1
+        self._reset()
+
+        if on_done: on_done(True)
+
+
+    def shutdown(self):
+        # the window is closing: drop the run without calling back into Tk,
+        # jobs still running finish on their own and are discarded
+        self._on_done = None
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+    def _reset(self):
+        if getattr(self, "_poll_id", None) is not None:
+            try: self.root.after_cancel(self._poll_id)
+            except Exception: pass
+
+        self._poll_id = None
+        self._items = None
+        self._in_flight = []
+        self._total = 0
+        self._done = 0
+        self._job = None
+        self._on_result = None
+        self._on_progress = None
+        self._on_done = None
+
+
+    def _schedule(self):
+        while len(self._in_flight) < self.max_in_flight:
+            item = next(self._items, None)
+            if item is None: break
+            self._in_flight.append((item, self._pool.submit(self._job, item)))
+
+
+    def _poll(self, generation):
+        self._poll_id = None
+        if generation != self._generation: return
+
+        finished = [(item, fut) for item, fut in self._in_flight if fut.done()]
+        self._in_flight = [(item, fut) for item, fut in self._in_flight if not fut.done()]
+
+        for item, fut in finished:
+            try:
+                result = fut.result()
+            except Exception:
+                print("Background job error:")
+                traceback.print_exc()
+                continue
+
+            self._on_result(item, result)
+
+            # a callback may have cancelled or restarted the run
+            if generation != self._generation: return
+
+        self._done += len(finished)
+        self._schedule()
+
+        if finished and self._on_progress:
+            self._on_progress(self._done, self._total)
+
+        if not self._in_flight:
+            on_done = self._on_done
+            self._reset()
+            if on_done: on_done(False)
+            return
+
+        self._poll_id = self.root.after(self.poll_ms, self._poll, generation)
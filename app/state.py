@@ -1,23 +1,147 @@
-from .defs import PreprocessParams, DetectParams, PreprocessedImage
-
-from dataclasses import dataclass, field
+from .defs import PreprocessParams, DetectParams, STORE_ENTRIES, STORE_BYTES, WORK_MAX_DIM
+from .pipeline.cache import LRUCache, CacheView, StoredArray
+from .pipeline.imageio import load_image, load_scaled, read_shape, scale_to_fit
+from .pipeline.mask import overlay
+from .pipeline.result import DetectionResult
+from .pipeline.trace import TRACE
+
+import cv2
 import numpy as np
 from typing import  List
 
 
-@dataclass
-class ImageState:
-    path: str
-    filename: str
+# decoded originals and every derived array of every image, one byte budget
+STORE = LRUCache(STORE_ENTRIES, STORE_BYTES)
+
+
+def set_store_budget(megabytes: float):
+    STORE.set_budget(int(megabytes * 1024 * 1024))
+
+
+class PreprocessedImage:
+    # Grayscale working image. With a cache and a loader the array lives in
+    # the store and is recomputed after eviction, otherwise it is pinned.
+
+    def __init__(self, img: np.ndarray | None = None, texture="low_txt", key=(), cache=None, loader=None):
+        self.texture = texture
+        # stage key of `img`, detection stages are keyed on top of it
+        self.key = key
+        self.slot = StoredArray(cache, key or None, img, loader)
+        self.cache = cache
+        # scales -> (lo, hi) the max variance over them is normalized with
+        self.var_bounds = {}
+
+
+    @property
+    def img(self):
+        return self.slot.get()
+
+
+    @property
+    def ready(self):
+        return self.slot.present
 
-    original: np.ndarray
-    preprocessed: PreprocessedImage = field(default_factory=PreprocessedImage)
-    detected: np.ndarray | None = None
 
-    preprocess_params: PreprocessParams = field(default_factory=PreprocessParams)
-    detect_params: DetectParams = field(default_factory=DetectParams)
+    def variance(self, k):
+        # raw float32 local variance at window k while it is in the store,
+        # left there by texture estimation or an earlier detection
+        if self.cache is None or not self.key: return None
+        return self.cache.get((self.key, "var_raw", k))
+
+
+    def keep_variance(self, k, var):
+        if self.cache is None or not self.key: return
+        self.cache.put((self.key, "var_raw", k), var)
+
+
+class ImageState:
+    # Path, params and metadata. The decoded original and everything derived
+    # from it live in STORE under this image's namespace. `scaled` is the
+    # working-size image, always decoded at reduced resolution from the file
+    # so it does not depend on what is resident; only `original` forces a
+    # full decode. An `original` handed in is pinned and stands in for the
+    # file, which may not exist.
+
     custom = False
     info = ""
+    # SavedCopy when opened from a project file
+    saved = None
+
+    def __init__(self, path: str, filename: str, original: np.ndarray | None = None,
+                 preprocessed: PreprocessedImage | None = None, detection: DetectionResult | None = None,
+                 preprocess_params: PreprocessParams | None = None, detect_params: DetectParams | None = None,
+                 shape=None):
+        self.path = path
+        self.filename = filename
+        # full resolution shape, from the header until the first full decode
+        self.shape = original.shape if original is not None else shape
+
+        self.preprocess_params = preprocess_params or PreprocessParams()
+        self.detect_params = detect_params or DetectParams()
+
+        self.cache = CacheView(STORE)
+        if original is not None:
+            self.original_slot = StoredArray(None, None, original)
+        else:
+            self.original_slot = StoredArray(self.cache, ("original",), loader=self._decode)
+        self.scaled_slot = StoredArray(self.cache, ("scaled",), loader=self._decode_scaled)
+        self.preprocessed = preprocessed or PreprocessedImage()
+        # result of the last detect, packed mask and component stats
+        self.detection = detection
+
+
+    def __repr__(self):
+        return f"ImageState(path={self.path!r}, shape={self.shape})"
+
+
+    @property
+    def original(self):
+        return self.original_slot.get()
+
+
+    @original.setter
+    def original(self, value):
+        self.original_slot = StoredArray(None, None, value)
+
+
+    @property
+    def scaled(self):
+        return self.scaled_slot.get()
+
+
+    @property
+    def detected(self):
+        # full resolution overlay, composited on every call (exports only)
+        if self.detection is None: return None
+        return overlay(self.original, self.detection.mask.unpack())
+
+
+    def thumbnail(self, stage, size=32):
+        # size x size BGR icon of "original", "preprocessed" or "detected"
+        if stage == "original":
+            return cv2.resize(self.scaled, (size, size))
+        if stage == "preprocessed":
+            return cv2.cvtColor(cv2.resize(self.preprocessed.img, (size, size)), cv2.COLOR_GRAY2BGR)
+        return overlay(cv2.resize(self.scaled, (size, size)), self.detection.mask.resized(size, size))
+
+
+    def release(self):
+        self.cache.clear()
+
+
+    def _decode(self):
+        img = TRACE.call("decode", self, load_image, self.path, source=lambda: self.shape or read_shape(self.path))
+        self.shape = img.shape
+        return img
+
+
+    def _decode_scaled(self):
+        if self.original_slot.loader is None:
+            return scale_to_fit(self.original_slot.get(), WORK_MAX_DIM)
+
+        if self.shape is None:
+            self.shape = read_shape(self.path)
+        return TRACE.call("decode_scaled", self, load_scaled, self.path, WORK_MAX_DIM, self.shape, source=lambda: self.shape)
 
 
 class AppState:
@@ -37,9 +161,17 @@ class AppState:
         self._notify()
 
 
+    def add_images(self, images: List[ImageState]):
+        # one notify for the whole batch
+        if not images: return
+        self.images.extend(images)
+        self.active_index = len(self.images) - 1
+        self._notify()
+
+
     def remove_image(self, index: int):
         if 0 <= index < len(self.images):
-            self.images.pop(index)
+            self.images.pop(index).release()
             if not self.images:
                 self.active_index = -1
             else:
@@ -48,6 +180,8 @@ class AppState:
 
 
     def clear_images(self):
+        for img in self.images:
+            img.release()
         self.images.clear()
         self.active_index = -1
         self._notify()
@@ -63,9 +197,8 @@ class AppState:
         if self.active_index == -1:
             return None
         return self.images[self.active_index]
-    
+
 
     def _notify(self):
         for callback in self._listeners:
             callback()
-    
\ No newline at end of file